@@ -0,0 +1,62 @@
+# batch.py
+
+import argparse
+import asyncio
+import json
+
+from graph.batch import run_batch, manifest_items, BATCH_MAX_CONCURRENCY
+from tools.llm_inference import bypass_cache
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run one instruction over many files, e.g. "
+                    "python batch.py \"Summarize this\" docs/*.pdf"
+    )
+    parser.add_argument("instruction", help="What to do with every item")
+    parser.add_argument("inputs", nargs="*", help="File paths or YouTube URLs")
+    parser.add_argument("--manifest", help="JSON file listing paths, URLs or {path|url|text} objects")
+    parser.add_argument("--concurrency", type=int, default=BATCH_MAX_CONCURRENCY)
+    parser.add_argument("--clarification", help="Answer to a clarification question")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    parser.add_argument("--no-cache", action="store_true", help="Don't reuse cached LLM responses")
+    args = parser.parse_args()
+
+    if args.no_cache:
+        bypass_cache()
+
+    entries = list(args.inputs)
+    if args.manifest:
+        with open(args.manifest, encoding="utf-8") as f:
+            entries.extend(json.load(f))
+
+    items = manifest_items(entries, allow_paths=True)
+    result = asyncio.run(run_batch(
+        args.instruction, items,
+        clarification=args.clarification,
+        concurrency=args.concurrency
+    ))
+
+    print("=" * 80)
+    if result["type"] == "clarification":
+        print("CLARIFICATION NEEDED")
+        print("=" * 80)
+        print(f"Question: {result['message']}")
+        print("\nRun again with --clarification \"your answer\"")
+    else:
+        print("BATCH RESULTS")
+        print("=" * 80)
+        for item in result["results"]:
+            print(f"  • {item['name']}: {item['status']}")
+
+    output = json.dumps(result, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"\nResults written to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import asyncio
+import os
+from typing import Any, Dict, List, Optional
+
+from graph.state import AgentState, new_state
+from graph.workflow import batch_app
+from nodes import input_handler, intent_detector
+from nodes.executor import task_results
+from tools.log import get_logger
+
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+
+logger = get_logger("batch")
+
+# Intent results shared by every item of the same input type
+INTENT_FIELDS = ["detected_intent", "detected_intents", "intent_confidence", "needs_clarification", "clarification_question"]
+
+
+def manifest_items(entries: List[Any], allow_paths: bool = False) -> List[Dict[str, Any]]:
+    """
+    Turn manifest entries into batch items. An entry is a path or URL
+    string, or an object with one of "path", "url" or "text". Local paths
+    are only accepted when `allow_paths` is set (i.e. from the CLI).
+    """
+    items = []
+    for i, entry in enumerate(entries):
+        if isinstance(entry, str):
+            entry = {"url": entry} if entry.startswith(("http://", "https://")) else {"path": entry}
+
+        if "url" in entry:
+            items.append({"name": entry.get("name", entry["url"]), "url": entry["url"]})
+        elif "text" in entry:
+            if not allow_paths and os.path.exists(entry["text"]):
+                raise ValueError(f"Manifest entry {i}: text must not be a server path")
+            items.append({"name": entry.get("name", f"text-{i}"), "input_data": entry["text"]})
+        elif "path" in entry:
+            if not allow_paths:
+                raise ValueError(f"Manifest entry {i}: local paths are only allowed from the CLI")
+            items.append({"name": entry.get("name", entry["path"]), "input_data": entry["path"]})
+        else:
+            raise ValueError(f"Manifest entry {i} needs a path, url or text")
+
+    return items
+
+
+def _item_state(instruction: str, item: Dict[str, Any], clarification: Optional[str]) -> AgentState:
+    # YouTube items are detected from the prompt, as in a normal chat
+    prompt = f"{instruction} {item['url']}" if item.get("url") else instruction
+    return new_state(
+        prompt,
+        input_data=item.get("input_data"),
+        input_file=item.get("input_file"),
+        user_clarification=clarification
+    )
+
+
+async def _detect_intents(instruction: str, input_types: List[str],
+                          clarification: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    """Detect intent once per distinct input type instead of once per file"""
+
+    async def detect(input_type):
+        state = new_state(instruction, user_clarification=clarification)
+        state["input_type"] = input_type
+        state.update(await intent_detector.aprocess(state))
+        return input_type, {key: state[key] for key in INTENT_FIELDS}
+
+    return dict(await asyncio.gather(*(detect(t) for t in sorted(set(input_types)))))
+
+
+async def run_batch(instruction: str, items: List[Dict[str, Any]], clarification: Optional[str] = None,
+                    concurrency: int = BATCH_MAX_CONCURRENCY) -> Dict[str, Any]:
+    """
+    Run one instruction over many items. Intent is resolved up front;
+    extraction and tool execution then run per item, at most
+    `concurrency` at a time. A failing item doesn't fail the batch.
+    """
+    if not items:
+        raise ValueError("Batch has no items")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f"Batch has {len(items)} items, the limit is {BATCH_MAX_ITEMS}")
+
+    logger.info("Running '%s' over %d items", instruction, len(items))
+
+    states = [_item_state(instruction, item, clarification) for item in items]
+    input_types = [
+        input_handler.detect_input_type(s["user_prompt"], s["input_data"], s["input_file"])
+        for s in states
+    ]
+    intents = await _detect_intents(instruction, input_types, clarification)
+
+    unclear = [t for t, intent in intents.items() if intent["needs_clarification"]]
+    if unclear:
+        return {
+            "type": "clarification",
+            "message": intents[unclear[0]]["clarification_question"],
+            "intents": intents
+        }
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_item(item, state, input_type):
+        state.update(intents[input_type])
+        async with semaphore:
+            try:
+                final_state = await batch_app.ainvoke(state)
+                return {
+                    "name": item["name"],
+                    "status": "ok",
+                    "input_type": final_state["input_type"],
+                    "extraction_metadata": final_state["extraction_metadata"],
+                    "result": task_results(final_state)
+                }
+            except Exception as e:
+                logger.error("Item failed: %s: %s", item["name"], e)
+                return {"name": item["name"], "status": "error", "error": str(e)}
+
+    results = await asyncio.gather(*(
+        run_item(item, state, input_type)
+        for item, state, input_type in zip(items, states, input_types)
+    ))
+
+    return {
+        "type": "batch",
+        "intents": intents,
+        "results": list(results)
+    }
@@ -1,27 +1,98 @@
-from typing import TypedDict, Optional, List, Dict, Any
+import json
+import operator
+import os
+from typing import Annotated, TypedDict, Optional, List, Dict, Any
 
 class AgentState(TypedDict):
     # Input
     user_prompt: str                          # "Summarize this audio"
     input_type: str                           # "audio", "image", "pdf", "text", "youtube"
-    input_data: Optional[str]                 # File path or text content
+    input_data: Optional[str]                 # File path, upload filename or text content
+    input_file: Optional[Any]                 # Uploaded file object (in memory or spooled)
+    asr_model: Optional[str]                  # Whisper size for audio, None = default
     
     # Extracted Content
     extracted_content: Optional[str]          # Transcribed/OCR'd/parsed text
     extraction_metadata: Optional[Dict]       # {confidence, duration, pages, etc}
+    extraction_key: Optional[str]             # Extraction cache entry holding the content
     
     # Intent & Clarity
     detected_intent: Optional[str]            # "summarize", "sentiment", etc.
+    detected_intents: List[str]               # Every requested intent, main one first
     intent_confidence: float                  # 0.0 - 1.0
     needs_clarification: bool                 # True if ambiguous
     clarification_question: Optional[str]     # Question to ask user
     user_clarification: Optional[str]         # User's clarification response
     
     # Planning & Execution
-    execution_plan: List[str]                 # ["transcribe", "summarize"]
-    current_step: int                         # Current step in plan
-    step_results: Dict[str, Any]              # Results from each step
+    execution_plan: List[Dict[str, Any]]      # [{"id", "task", "deps"}], a task DAG
+    current_step: int                         # Number of finished plan steps
+    step_results: Dict[str, Any]              # Result (or {"error"}) per plan step id
     
     # Output
     final_output: str                         # Final formatted result
-    logs: List[str]                           # Execution logs
\ No newline at end of file
+    # {node, message, ...} events (none if STATE_LOGS=0). Nodes return only
+    # their new events and they are appended, since the extract and intent
+    # nodes run in parallel and both write logs
+    logs: Annotated[List[Dict[str, Any]], operator.add]
+
+
+# What a clarification turn needs to resume at intent detection without
+# extracting the input again. The content and metadata are re-read from the
+# extraction cache; only results that aren't cached are kept in the session,
+# and only up to RESUME_INLINE_CHARS (sessions are capped by count, not size)
+RESUME_FIELDS = ["user_prompt", "input_data", "input_type", "extraction_key"]
+RESUME_INLINE_CHARS = int(os.getenv("RESUME_INLINE_CHARS", "65536"))
+
+
+def new_state(user_prompt: str, input_data: Optional[str] = None, input_file: Optional[Any] = None,
+              user_clarification: Optional[str] = None, asr_model: Optional[str] = None) -> AgentState:
+    """Initial state for a fresh run of the workflow"""
+    return AgentState(
+        user_prompt=user_prompt,
+        input_data=input_data,
+        input_file=input_file,
+        asr_model=asr_model,
+        input_type="",
+        extracted_content=None,
+        extraction_metadata=None,
+        extraction_key=None,
+        detected_intent=None,
+        detected_intents=[],
+        intent_confidence=0.0,
+        needs_clarification=False,
+        clarification_question=None,
+        user_clarification=user_clarification,
+        execution_plan=[],
+        current_step=0,
+        step_results={},
+        final_output="",
+        logs=[]
+    )
+
+
+def resume_snapshot(state: AgentState) -> Dict[str, Any]:
+    """JSON-serialisable part of a run that stopped to ask for clarification"""
+    snapshot = {key: state.get(key) for key in RESUME_FIELDS}
+    if not snapshot["extraction_key"]:
+        extracted = {"content": state.get("extracted_content"), "metadata": state.get("extraction_metadata")}
+        if len(json.dumps(extracted)) <= RESUME_INLINE_CHARS:
+            snapshot["extracted"] = extracted
+    return snapshot
+
+
+def resume_state(snapshot: Dict[str, Any], user_clarification: str, extracted: Dict[str, Any]) -> AgentState:
+    """
+    State for answering a clarification, with `extracted` (the content
+    and metadata extracted last turn) already in place
+    """
+    state = new_state(
+        snapshot["user_prompt"],
+        input_data=snapshot.get("input_data"),
+        user_clarification=user_clarification
+    )
+    state["input_type"] = snapshot["input_type"]
+    state["extracted_content"] = extracted["content"]
+    state["extraction_metadata"] = extracted["metadata"]
+    state["extraction_key"] = snapshot.get("extraction_key")
+    return state
@@ -1,5 +1,10 @@
+import functools
+import inspect
+import time
+
 from langgraph.graph import StateGraph, END
 from graph.state import AgentState
+from tools import metrics
 from nodes import (
     input_handler,
     intent_detector,
@@ -20,39 +25,108 @@ def should_continue_execution(state: AgentState) -> str:
         return "execute"
     return "format"
 
-# Build graph
-workflow = StateGraph(AgentState)
-
-# Add nodes
-workflow.add_node("input", input_handler.process)
-workflow.add_node("intent", intent_detector.process)
-workflow.add_node("plan", planner.process)
-workflow.add_node("execute", executor.process)
-workflow.add_node("format", output_formatter.process)
-
-# Define flow
-workflow.set_entry_point("input")
-workflow.add_edge("input", "intent")
-
-workflow.add_conditional_edges(
-    "intent",
-    should_ask_clarification,
-    {
-        "clarify": END,
-        "plan": "plan"
-    }
-)
+def _timed(name: str, node):
+    """Wrap a node so its wall time is recorded as a metrics span"""
+    if inspect.iscoroutinefunction(node):
+        @functools.wraps(node)
+        async def run(state: AgentState) -> AgentState:
+            start = time.perf_counter()
+            try:
+                return await node(state)
+            finally:
+                metrics.record_node(name, time.perf_counter() - start)
+    else:
+        @functools.wraps(node)
+        def run(state: AgentState) -> AgentState:
+            start = time.perf_counter()
+            try:
+                return node(state)
+            finally:
+                metrics.record_node(name, time.perf_counter() - start)
+    return run
 
-workflow.add_edge("plan", "execute")
 
-workflow.add_conditional_edges(
-    "execute",
-    should_continue_execution,
-    {
-        "execute": "execute",
-        "format": "format"
-    }
-)
+def join(state: AgentState) -> dict:
+    """Wait for extraction and intent detection before planning"""
+    return {}
+
+
+def build_workflow(input_node, intent_node, execute_node):
+    """
+    Build the agent graph. The sync and async apps share the same wiring
+    and differ only in the node implementations that do I/O.
+    
+    The input type is detected first (from the file name or prompt), then
+    extraction ("input") and intent detection run in parallel and meet at
+    "join", so the intent LLM call doesn't wait behind OCR or
+    transcription. Nodes return partial updates for the same reason.
+    
+    Without an intent node the graph expects detected_intent to be filled
+    in already (used by batch runs, which detect intent once per batch).
+    Without an input node it starts at intent with the content already
+    extracted (used to resume a run after a clarification question).
+    """
+    workflow = StateGraph(AgentState)
+
+    # Add nodes
+    if input_node is not None:
+        workflow.add_node("detect", _timed("detect", input_handler.detect))
+        workflow.add_node("input", _timed("input", input_node))
+    if intent_node is not None:
+        workflow.add_node("intent", _timed("intent", intent_node))
+    workflow.add_node("join", join)
+    workflow.add_node("plan", _timed("plan", planner.process))
+    workflow.add_node("execute", _timed("execute", execute_node))
+    workflow.add_node("format", _timed("format", output_formatter.process))
+
+    # Define flow: detect fans out to input and intent, which meet at join
+    branches = []
+    if input_node is not None:
+        workflow.set_entry_point("detect")
+        workflow.add_edge("detect", "input")
+        branches.append("input")
+    if intent_node is not None:
+        if input_node is not None:
+            workflow.add_edge("detect", "intent")
+        else:
+            workflow.set_entry_point("intent")
+        branches.append("intent")
+    workflow.add_edge(branches, "join")
+
+    if intent_node is not None:
+        workflow.add_conditional_edges(
+            "join",
+            should_ask_clarification,
+            {
+                "clarify": END,
+                "plan": "plan"
+            }
+        )
+    else:
+        workflow.add_edge("join", "plan")
+
+    workflow.add_edge("plan", "execute")
+
+    workflow.add_conditional_edges(
+        "execute",
+        should_continue_execution,
+        {
+            "execute": "execute",
+            "format": "format"
+        }
+    )
+
+    workflow.add_edge("format", END)
+    return workflow.compile()
+
+
+app = build_workflow(input_handler.process, intent_detector.process, executor.process)
+
+# Used with `ainvoke` by the API so one worker can serve many chats at once
+async_app = build_workflow(input_handler.aprocess, intent_detector.aprocess, executor.aprocess)
+
+# Per-item pipeline for batches: extraction and execution only
+batch_app = build_workflow(input_handler.aprocess, None, executor.aprocess)
 
-workflow.add_edge("format", END)
-app = workflow.compile()
\ No newline at end of file
+# Answers to a clarification question: starts at intent, skipping extraction
+resume_app = build_workflow(None, intent_detector.aprocess, executor.aprocess)
@@ -0,0 +1,227 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from tools.log import get_logger
+from tools.offload import use_background_pool
+
+# Long-running work (audio, YouTube, scanned PDFs, batches) can be submitted
+# as a job instead of holding an HTTP request open. Each job kind has its
+# own concurrency limit; finished jobs are kept for JOB_RETENTION seconds.
+JOB_CONCURRENCY = {
+    "audio": int(os.getenv("JOB_CONCURRENCY_AUDIO", "1")),
+    "youtube": int(os.getenv("JOB_CONCURRENCY_YOUTUBE", "2")),
+    "pdf": int(os.getenv("JOB_CONCURRENCY_PDF", "2")),
+    "batch": int(os.getenv("JOB_CONCURRENCY_BATCH", "1")),
+}
+JOB_DEFAULT_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "3600"))
+
+# A job runs in the worker that accepted it; its status and result go to the
+# job store so any worker can answer for it. "sqlite" (the default when
+# sessions are in SQLite) is needed with --workers N, "memory" is per process.
+JOB_STORE = os.getenv("JOB_STORE", os.getenv("SESSION_STORE", "memory"))
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(".cache", "jobs.sqlite"))
+# How often a watcher polls for a job that runs in another worker
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+
+logger = get_logger("jobs")
+
+FINISHED = ("done", "error")
+
+
+def _dumps(job: dict) -> str:
+    return json.dumps(job, separators=(",", ":"), default=str)
+
+
+class JobStore(ABC):
+    """Job records shared by the workers; finished jobs can be purged"""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def save(self, job: dict, finished: Optional[float] = None):
+        ...
+
+    @abstractmethod
+    def purge(self, cutoff: float):
+        """Drop jobs that finished before `cutoff`"""
+
+
+class MemoryJobStore(JobStore):
+    def __init__(self):
+        self._jobs: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._jobs.get(job_id)
+        return json.loads(entry[0]) if entry else None
+
+    def save(self, job: dict, finished: Optional[float] = None):
+        with self._lock:
+            self._jobs[job["job_id"]] = (_dumps(job), finished)
+
+    def purge(self, cutoff: float):
+        with self._lock:
+            for job_id, (_, finished) in list(self._jobs.items()):
+                if finished is not None and finished < cutoff:
+                    del self._jobs[job_id]
+
+
+class SQLiteJobStore(JobStore):
+    """File-backed store that several uvicorn workers can share"""
+
+    def __init__(self, path: str = JOB_DB_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, data TEXT, finished REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished)")
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, job: dict, finished: Optional[float] = None):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (id, data, finished) VALUES (?, ?, ?)",
+                (job["job_id"], _dumps(job), finished)
+            )
+            self._db.commit()
+
+    def purge(self, cutoff: float):
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE finished < ?", (cutoff,))
+            self._db.commit()
+
+
+def create_job_store() -> JobStore:
+    if JOB_STORE == "sqlite":
+        return SQLiteJobStore()
+    if JOB_STORE == "memory":
+        return MemoryJobStore()
+    raise ValueError(f"Unknown JOB_STORE: {JOB_STORE}")
+
+
+class JobQueue:
+    """Job runner with per-kind concurrency limits; records live in a JobStore"""
+
+    def __init__(self, limits: Dict[str, int] = JOB_CONCURRENCY,
+                 default_limit: int = JOB_DEFAULT_CONCURRENCY, retention: float = JOB_RETENTION,
+                 store: Optional[JobStore] = None):
+        self.limits = limits
+        self.default_limit = default_limit
+        self.retention = retention
+        self.store = store or create_job_store()
+        # Jobs running in this worker, until they finish
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._changed: Dict[str, asyncio.Event] = {}
+        self._tasks = set()
+
+    def submit(self, kind: str, work: Callable[[], Awaitable[Any]],
+               cleanup: Optional[Callable[[], None]] = None) -> str:
+        """Queue `work` (a coroutine function) and return its job ID"""
+        self._purge()
+
+        job_id = str(uuid.uuid4())
+        self._jobs[job_id] = {
+            "job_id": job_id,
+            "kind": kind,
+            "status": "queued",
+            "created": datetime.now().isoformat(),
+            "started": None,
+            "finished": None,
+            "result": None,
+            "error": None
+        }
+        self.store.save(self._jobs[job_id])
+        self._changed[job_id] = asyncio.Event()
+
+        task = asyncio.create_task(self._run(job_id, kind, work, cleanup))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        logger.info("Queued %s job %s", kind, job_id)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        self._purge()
+        job = self._jobs.get(job_id)
+        return dict(job) if job else self.store.get(job_id)
+
+    async def watch(self, job_id: str):
+        """
+        Yield a snapshot of the job every time its status changes; jobs of
+        other workers are polled every JOB_POLL_INTERVAL seconds
+        """
+        last = None
+        while True:
+            event = self._changed.get(job_id)
+            if event is not None:
+                event.clear()
+            job = self.get(job_id)
+            if job is None:
+                return
+            if job != last:
+                yield job
+                last = job
+            if job["status"] in FINISHED:
+                return
+            if event is not None:
+                await event.wait()
+            else:
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    def _semaphore(self, kind: str) -> asyncio.Semaphore:
+        if kind not in self._semaphores:
+            self._semaphores[kind] = asyncio.Semaphore(self.limits.get(kind, self.default_limit))
+        return self._semaphores[kind]
+
+    def _update(self, job_id: str, finished_at: Optional[float] = None, **fields):
+        job = self._jobs[job_id]
+        job.update(fields)
+        self.store.save(job, finished_at)
+        if finished_at is not None:
+            # The store has it now; watchers re-read it from there
+            del self._jobs[job_id]
+            self._changed.pop(job_id).set()
+        else:
+            self._changed[job_id].set()
+
+    async def _run(self, job_id: str, kind: str, work, cleanup):
+        outcome = {"status": "error", "error": "Job was cancelled"}
+        try:
+            async with self._semaphore(kind):
+                use_background_pool()
+                self._update(job_id, status="running", started=datetime.now().isoformat())
+                try:
+                    outcome = {"status": "done", "result": await work()}
+                except Exception as e:
+                    logger.error("Job %s failed: %s", job_id, e)
+                    outcome = {"status": "error", "error": str(e)}
+        finally:
+            if cleanup:
+                cleanup()
+            self._update(job_id, finished_at=time.time(), finished=datetime.now().isoformat(), **outcome)
+
+    def _purge(self):
+        self.store.purge(time.time() - self.retention)
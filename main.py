@@ -1,16 +1,31 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.formparsers import MultiPartParser
 import uvicorn
+import asyncio
+import io
+import json
 import os
-import shutil
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 import uuid
 
-from graph.workflow import app as workflow_app
-from graph.state import AgentState
+from graph.state import AgentState, new_state, resume_snapshot, resume_state
+from graph.batch import run_batch, manifest_items
+from session_store import create_session_store, new_session
+from job_queue import JobQueue
+from nodes.input_handler import detect_input_type, restore_extraction
+from nodes.executor import task_results
+from graph.workflow import async_app as async_workflow_app, resume_app
+from tools.cache import all_stats as cache_stats
+from tools.llm_inference import aclose_clients, bypass_cache, set_token_sink, reset_token_sink, router as llm_router
+from tools.offload import shutdown_executor
+from tools.pdf_parser import shutdown_ocr_pool
+from tools import metrics, whisper_models
+from tools.log import get_logger
+from tools.asr import ASR_BACKEND
 
 # Initialize FastAPI
 app = FastAPI(
@@ -29,11 +44,87 @@ app.add_middleware(
 )
 
 # Create necessary directories
-os.makedirs("uploads", exist_ok=True)
 os.makedirs("static", exist_ok=True)
 
-# Session storage (in-memory for now)
-sessions = {}
+# Uploads are parsed into spooled files held in memory up to
+# UPLOAD_SPOOL_BYTES that spill to an anonymous temp file above that, and
+# are handed to the extractors as is. Request bodies are counted as they
+# arrive, so anything over UPLOAD_MAX_BYTES is rejected while streaming.
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(200 * 1024 * 1024)))
+MultiPartParser.spool_max_size = UPLOAD_SPOOL_BYTES
+
+# Session storage: bounded in-memory by default, SQLite (SESSION_STORE=sqlite)
+# when several workers need to share sessions
+sessions = create_session_store()
+
+# Background jobs for long-running extractions (see /api/jobs)
+jobs = JobQueue()
+
+logger = get_logger("api")
+
+@app.on_event("startup")
+async def startup():
+    """Load the Whisper model(s) in the background so audio requests don't wait"""
+    if ASR_BACKEND == "local":
+        whisper_models.preload()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Release pooled LLM connections and extraction workers"""
+    await aclose_clients()
+    llm_router.shutdown()
+    shutdown_executor()
+    shutdown_ocr_pool()
+
+
+class UploadLimitMiddleware:
+    """
+    Reject oversized bodies: up front from Content-Length, and otherwise
+    as soon as the bytes received pass the limit (chunked uploads)
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            return await self.app(scope, receive, send)
+        
+        limit = (BATCH_MAX_BYTES if scope["path"] == "/api/batch" else UPLOAD_MAX_BYTES) + UPLOAD_CHUNK_BYTES
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None:
+            try:
+                size = int(length)
+            except ValueError:
+                size = -1
+            if size < 0:
+                response = JSONResponse(status_code=400, content={"detail": "Invalid Content-Length"})
+                return await response(scope, receive, send)
+            if size > limit:
+                response = JSONResponse(status_code=413, content={"detail": "Upload too large"})
+                return await response(scope, receive, send)
+        
+        received = 0
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside form parsing; FastAPI passes it through as a 413
+                    raise HTTPException(status_code=413, detail="Upload too large")
+            return message
+        
+        await self.app(scope, limited_receive, send)
+
+
+app.add_middleware(UploadLimitMiddleware)
+
 
 @app.get("/", response_class=HTMLResponse)
 async def home():
@@ -44,8 +135,160 @@ async def home():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    """
+    Health check endpoint; `ready` turns true once the Whisper model is
+    loaded. `llm` shows each provider's circuit breaker and hedge delay.
+    """
+    asr_status = whisper_models.status() if ASR_BACKEND == "local" else {"ready": True}
+    return {
+        "status": "healthy",
+        "ready": asr_status["ready"],
+        "asr": {"backend": ASR_BACKEND, **asr_status},
+        "llm": llm_router.status(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Node, LLM, extraction, OCR and cache metrics in Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Hit/miss counters for the in-process caches"""
+    return cache_stats()
+
+
+def _get_session(session_id: Optional[str]):
+    """Return (session_id, session), creating the session if needed"""
+    if not session_id:
+        session_id = str(uuid.uuid4())
+    
+    session = sessions.get(session_id) or new_session()
+    return session_id, session
+
+
+def _take_upload(file: Optional[UploadFile]):
+    """
+    Return the upload's spooled file without copying it, enforcing
+    UPLOAD_MAX_BYTES. The form would close it once the response is sent,
+    but jobs and batches outlive the response, so the caller takes it over
+    and must close it.
+    """
+    if not file:
+        return None
+    
+    if file.size is not None and file.size > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Upload too large")
+    
+    buffer, file.file = file.file, io.BytesIO()
+    buffer.seek(0)
+    logger.info("File uploaded: %s (%s bytes)", file.filename, file.size)
+    return buffer
+
+
+def _close_upload(buffer):
+    if buffer is not None:
+        buffer.close()
+
+
+def _check_asr_model(asr_model: Optional[str]):
+    if asr_model and asr_model not in whisper_models.WHISPER_MODELS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"asr_model must be one of {whisper_models.WHISPER_MODELS}"
+        )
+
+
+def _initial_state(message: str, file: Optional[UploadFile], buffer,
+                   clarification: Optional[str], asr_model: Optional[str] = None) -> AgentState:
+    return new_state(
+        message,
+        input_data=file.filename if file else None,
+        input_file=buffer,
+        user_clarification=clarification,
+        asr_model=asr_model
+    )
+
+
+def _prepare_run(session: dict, message: str, file: Optional[UploadFile], buffer,
+                 clarification: Optional[str], asr_model: Optional[str] = None):
+    """
+    Return (workflow, initial_state). An answer to a pending clarification
+    resumes at intent detection with the content extracted last turn;
+    anything else (including a new upload) starts a fresh run.
+    """
+    pending = session.get("pending_clarification") or {}
+    if clarification and pending.get("state") and file is None:
+        extracted = restore_extraction(pending["state"])
+        if extracted is not None:
+            logger.info("Resuming %s input after clarification", pending["state"]["input_type"])
+            return resume_app, resume_state(pending["state"], clarification, extracted)
+        logger.info("Content of the pending run is gone; starting over")
+    return async_workflow_app, _initial_state(message, file, buffer, clarification, asr_model)
+
+
+def _skip_cache(no_cache: bool):
+    """Bypass the LLM response cache for the rest of this request"""
+    if no_cache:
+        bypass_cache()
+
+
+def _start_trace(debug: bool):
+    return metrics.start_trace() if debug else None
+
+
+def _attach_trace(response: dict, trace) -> dict:
+    """Add the request's metrics to the response when debug was set"""
+    if trace is not None:
+        response["metrics"] = metrics.summarize(trace)
+    return response
+
+
+def _finish_turn(session_id: str, session: dict, message: str, file: Optional[UploadFile],
+                 clarification: Optional[str], final_state: AgentState) -> dict:
+    """Record the turn in the session and build the API response"""
+    
+    # Check if clarification is needed
+    if final_state["needs_clarification"] and not clarification:
+        session["pending_clarification"] = {
+            "question": final_state["clarification_question"],
+            "state": resume_snapshot(final_state)
+        }
+        sessions.save(session_id, session)
+        
+        return {
+            "type": "clarification",
+            "message": final_state["clarification_question"],
+            "session_id": session_id
+        }
+    
+    # Add to conversation history
+    session["history"].append({
+        "role": "user",
+        "message": message,
+        "file": file.filename if file else None,
+        "timestamp": datetime.now().isoformat()
+    })
+    
+    session["history"].append({
+        "role": "assistant",
+        "message": final_state["final_output"],
+        "logs": final_state["logs"],
+        "timestamp": datetime.now().isoformat()
+    })
+    
+    session["pending_clarification"] = None
+    sessions.save(session_id, session)
+    
+    return {
+        "type": "response",
+        "message": task_results(final_state),
+        "tasks": list(final_state["step_results"]),
+        "session_id": session_id
+    }
 
 
 @app.post("/api/chat")
@@ -53,7 +296,10 @@ async def chat(
     message: str = Form(...),
     file: Optional[UploadFile] = File(None),
     session_id: Optional[str] = Form(None),
-    clarification: Optional[str] = Form(None)
+    clarification: Optional[str] = Form(None),
+    asr_model: Optional[str] = Form(None),
+    debug: bool = Form(False),
+    no_cache: bool = Form(False)
 ):
     """
     Main chat endpoint - handles text messages and file uploads
@@ -63,110 +309,214 @@ async def chat(
         file: Optional uploaded file (image/pdf/audio)
         session_id: Session ID for conversation continuity
         clarification: Optional clarification response
+        asr_model: Optional Whisper size for audio (tiny/base/small)
+        debug: Attach this request's timings, token counts and cache hits
+        no_cache: Ask the LLM again instead of reusing cached tool responses
     
     Returns:
         JSON with agent response and metadata
     """
     
+    buffer = None
     try:
-        # Generate or retrieve session
-        if not session_id:
-            session_id = str(uuid.uuid4())
+        _check_asr_model(asr_model)
+        session_id, session = _get_session(session_id)
+        buffer = _take_upload(file)
         
-        # Initialize session if new
-        if session_id not in sessions:
-            sessions[session_id] = {
-                "history": [],
-                "pending_clarification": None
-            }
+        # Run the agent workflow
+        logger.info("Processing message: %s", message)
+        trace = _start_trace(debug)
+        _skip_cache(no_cache)
+        workflow, initial_state = _prepare_run(session, message, file, buffer, clarification, asr_model)
+        final_state = await workflow.ainvoke(initial_state)
         
-        session = sessions[session_id]
+        response = _finish_turn(session_id, session, message, file, clarification, final_state)
+        response = _attach_trace(response, trace)
         
-        # Handle file upload
-        file_path = None
-        if file:
-            # Save uploaded file
-            file_extension = os.path.splitext(file.filename)[1]
-            file_path = f"uploads/{uuid.uuid4()}{file_extension}"
-            
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            
-            print(f"[API] File uploaded: {file_path}")
+        return JSONResponse(content=response)
+    
+    except HTTPException:
+        raise
+    
+    except Exception as e:
+        logger.exception("Chat failed: %s", e)
         
-        # Prepare agent state
-        initial_state = AgentState(
-            user_prompt=message,
-            input_data=file_path,
-            input_type="",
-            extracted_content=None,
-            extraction_metadata=None,
-            detected_intent=None,
-            intent_confidence=0.0,
-            needs_clarification=False,
-            clarification_question=None,
-            user_clarification=clarification,
-            execution_plan=[],
-            current_step=0,
-            step_results={},
-            final_output="",
-            logs=[]
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "error": str(e),
+                "type": "processing_error"
+            }
         )
+    
+    finally:
+        _close_upload(buffer)
+
+
+# State fields reported with each node-progress event
+PROGRESS_FIELDS = {
+    "detect": ["input_type"],
+    "input": [],
+    "intent": ["detected_intent", "detected_intents", "needs_clarification"],
+    "plan": ["execution_plan"],
+    "execute": ["current_step"],
+    "format": [],
+}
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(
+    message: str = Form(...),
+    file: Optional[UploadFile] = File(None),
+    session_id: Optional[str] = Form(None),
+    clarification: Optional[str] = Form(None),
+    asr_model: Optional[str] = Form(None),
+    debug: bool = Form(False),
+    no_cache: bool = Form(False)
+):
+    """
+    Streaming variant of /api/chat using Server-Sent Events.
+    
+    Emits `progress` events as each graph node finishes, `token` events
+    as LLM output arrives, then a final `done` event carrying the same
+    payload /api/chat returns (or an `error` event). A `clarification`
+    event is sent as soon as intent detection asks a question, before
+    extraction has finished; `done` follows once the turn is saved.
+    """
+    
+    _check_asr_model(asr_model)
+    session_id, session = _get_session(session_id)
+    buffer = _take_upload(file)
+    workflow, initial_state = _prepare_run(session, message, file, buffer, clarification, asr_model)
+    queue = asyncio.Queue()
+    
+    async def run():
+        sink = set_token_sink(lambda text: queue.put_nowait(("token", {"text": text})))
+        trace = _start_trace(debug)
+        _skip_cache(no_cache)
+        try:
+            logger.info("Streaming message: %s", message)
+            final_state = initial_state
+            async for mode, chunk in workflow.astream(
+                initial_state, stream_mode=["updates", "values"]
+            ):
+                if mode == "values":
+                    final_state = chunk
+                    continue
+                for node, update in chunk.items():
+                    if node not in PROGRESS_FIELDS:
+                        continue
+                    update = update or {}
+                    queue.put_nowait(("progress", {
+                        "node": node,
+                        **{key: update.get(key) for key in PROGRESS_FIELDS[node]}
+                    }))
+                    # Intent runs alongside extraction, so the question can
+                    # be shown while the file is still being processed
+                    if node == "intent" and update.get("needs_clarification") and not clarification:
+                        queue.put_nowait(("clarification", {
+                            "message": update["clarification_question"],
+                            "session_id": session_id
+                        }))
+            
+            response = _finish_turn(session_id, session, message, file, clarification, final_state)
+            response = _attach_trace(response, trace)
+            queue.put_nowait(("done", response))
         
-        # Run the agent workflow
-        print(f"[API] Processing message: {message}")
-        final_state = workflow_app.invoke(initial_state)
+        except Exception as e:
+            logger.exception("Streaming chat failed: %s", e)
+            queue.put_nowait(("error", {"error": str(e), "type": "processing_error"}))
         
-        # Check if clarification is needed
-        if final_state["needs_clarification"] and not clarification:
-            session["pending_clarification"] = {
-                "question": final_state["clarification_question"],
-                "state": final_state
-            }
-            
-            response = {
-                "type": "clarification",
-                "message": final_state["clarification_question"],
-                "session_id": session_id
-            }
-        else:
-            # Add to conversation history
-            session["history"].append({
-                "role": "user",
-                "message": message,
-                "file": file.filename if file else None,
-                "timestamp": datetime.now().isoformat()
-            })
-            
-            session["history"].append({
-                "role": "assistant",
-                "message": final_state["final_output"],
-                "logs": final_state["logs"],
-                "timestamp": datetime.now().isoformat()
-            })
-            
-            session["pending_clarification"] = None
-            
-            response = {
-                "type": "response",
-                "message": final_state["step_results"],
-                "session_id": session_id
-            }
+        finally:
+            reset_token_sink(sink)
+            _close_upload(buffer)
+    
+    async def events():
+        task = asyncio.create_task(run())
+        try:
+            yield _sse("session", {"session_id": session_id})
+            while True:
+                event, data = await queue.get()
+                yield _sse(event, data)
+                if event in ("done", "error"):
+                    break
+        finally:
+            # Client went away: stop the run instead of finishing it unseen
+            if not task.done():
+                task.cancel()
+                _close_upload(buffer)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/api/batch")
+async def batch(
+    message: str = Form(...),
+    files: Optional[List[UploadFile]] = File(None),
+    manifest: Optional[str] = Form(None),
+    clarification: Optional[str] = Form(None),
+    background: bool = Form(False),
+    no_cache: bool = Form(False)
+):
+    """
+    Run one instruction over many files in a single request.
+    
+    Args:
+        message: Instruction applied to every item
+        files: Uploaded files (image/pdf/audio)
+        manifest: Optional JSON list of YouTube URLs or {"url"|"text": ...} items
+        clarification: Optional answer to a clarification question
+        background: Queue the batch as a job and return its ID instead
+        no_cache: Ask the LLM again instead of reusing cached tool responses
+    
+    Returns:
+        JSON with the batch intents and per-item results, or a job ID
+    """
+    
+    buffers = []
+    queued = False
+    try:
+        items = []
+        for file in files or []:
+            buffer = _take_upload(file)
+            buffers.append(buffer)
+            items.append({"name": file.filename, "input_data": file.filename, "input_file": buffer})
         
-        # Cleanup uploaded file
-        if file_path and os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except:
-                pass
+        if manifest:
+            items.extend(manifest_items(json.loads(manifest)))
+        
+        async def work():
+            _skip_cache(no_cache)
+            return await run_batch(message, items, clarification=clarification)
         
+        if background:
+            job_id = jobs.submit(
+                "batch",
+                work,
+                cleanup=lambda: [_close_upload(buffer) for buffer in buffers]
+            )
+            queued = True
+            return JSONResponse(content={"job_id": job_id, "status": "queued"})
+        
+        response = await work()
         return JSONResponse(content=response)
     
+    except HTTPException:
+        raise
+    
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={"error": str(e), "type": "invalid_batch"})
+    
     except Exception as e:
-        print(f"[API] Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        
+        logger.exception("Batch failed: %s", e)
         raise HTTPException(
             status_code=500,
             detail={
@@ -174,24 +524,96 @@ async def chat(
                 "type": "processing_error"
             }
         )
+    
+    finally:
+        # A queued batch closes its uploads when the job finishes
+        if not queued:
+            for buffer in buffers:
+                _close_upload(buffer)
+
+
+@app.post("/api/jobs")
+async def submit_job(
+    message: str = Form(...),
+    file: Optional[UploadFile] = File(None),
+    session_id: Optional[str] = Form(None),
+    clarification: Optional[str] = Form(None),
+    asr_model: Optional[str] = Form(None),
+    debug: bool = Form(False),
+    no_cache: bool = Form(False)
+):
+    """
+    Queue a chat turn as a background job. Use this for audio, YouTube and
+    scanned PDFs that may outlive client or proxy timeouts.
+    
+    Returns:
+        JSON with the job ID; poll /api/jobs/{job_id} or stream
+        /api/jobs/{job_id}/stream for its status and result
+    """
+    
+    _check_asr_model(asr_model)
+    session_id, session = _get_session(session_id)
+    buffer = _take_upload(file)
+    workflow, initial_state = _prepare_run(session, message, file, buffer, clarification, asr_model)
+    kind = initial_state["input_type"] or detect_input_type(message, initial_state["input_data"], buffer)
+    
+    async def work():
+        trace = _start_trace(debug)
+        _skip_cache(no_cache)
+        final_state = await workflow.ainvoke(initial_state)
+        # Load the session only now so turns made meanwhile aren't lost
+        _, session = _get_session(session_id)
+        response = _finish_turn(session_id, session, message, file, clarification, final_state)
+        return _attach_trace(response, trace)
+    
+    job_id = jobs.submit(kind, work, cleanup=lambda: _close_upload(buffer))
+    return {"job_id": job_id, "status": "queued", "session_id": session_id}
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status of a background job, with its result once finished"""
+    
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job
+
+
+@app.get("/api/jobs/{job_id}/stream")
+async def stream_job(job_id: str):
+    """Server-Sent Events with a `status` event on every job state change"""
+    
+    if jobs.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    
+    async def events():
+        async for job in jobs.watch(job_id):
+            yield _sse("status", job)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.get("/api/history/{session_id}")
 async def get_history(session_id: str):
     """Get conversation history for a session"""
     
-    if session_id not in sessions:
+    session = sessions.get(session_id)
+    if session is None:
         return {"history": []}
     
-    return {"history": sessions[session_id]["history"]}
+    return {"history": session["history"]}
 
 
 @app.delete("/api/session/{session_id}")
 async def clear_session(session_id: str):
     """Clear a conversation session"""
     
-    if session_id in sessions:
-        del sessions[session_id]
+    sessions.delete(session_id)
     
     return {"status": "cleared"}
 
@@ -1,4 +1,11 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Any, Dict, List
+
 from graph.state import AgentState
+from tools.llm_inference import set_token_sink
+from tools.log import get_logger, log_event
 from tools import (
     summarization, sentiment_analysis, code_analysis, conversation
 )
@@ -13,65 +20,155 @@ TASK_MAP = {
     "conversational_response": conversation.answer_question
 }
 
-def process(state: AgentState) -> AgentState:
-    if state["current_step"] >= len(state["execution_plan"]):
-        return state
-    
-    current_task = state["execution_plan"][state["current_step"]]
-    print(f"\n[EXECUTOR] Running task: {current_task}")
-    state["logs"].append(f"Executing: {current_task}")
-    
+# Same tasks, backed by the async tool variants for the async workflow
+ASYNC_TASK_MAP = {
+    **TASK_MAP,
+    "summarize": summarization.asummarize,
+    "sentiment_analysis": sentiment_analysis.aanalyze,
+    "code_explanation": code_analysis.aexplain,
+    "conversational_response": conversation.aanswer_question
+}
+
+# Tasks that hand a single argument to an LLM-backed tool
+LLM_TASKS = {"code_explanation", "summarize", "sentiment_analysis", "conversational_response"}
+
+logger = get_logger("executor")
+
+
+def _tool_input(current_task: str, state: AgentState) -> str:
+    if current_task == "conversational_response":
+        return state["user_prompt"]
+    return state.get("extracted_content", "")
+
+
+def _local_result(current_task: str, state: AgentState) -> str:
+    """Result for tasks that only reuse the already extracted content"""
+    content = state.get("extracted_content") or ""
+    if current_task == "transcribe":
+        return "Below is the transcribed of the given data:\n" + content
+    return content
+
+
+def _failed(result) -> bool:
+    return isinstance(result, dict) and "error" in result
+
+
+def _new_update(state: AgentState) -> Dict[str, Any]:
+    """Partial update for this hop; results are merged into a copy"""
+    return {"step_results": dict(state["step_results"]), "current_step": state["current_step"], "logs": []}
+
+
+def _record(update: Dict[str, Any], step: Dict[str, Any], result) -> None:
+    update["step_results"][step["id"]] = result
+    update["current_step"] = len(update["step_results"])
+    if _failed(result):
+        logger.error("Task %s failed: %s", step["id"], result["error"])
+        log_event(update, "execute", f"ERROR in {step['id']}: {result['error']}",
+                  task=step["id"], error=result["error"])
+    else:
+        logger.debug("Result of %s: %s", step["id"], result)
+        logger.info("Task completed: %s", step["id"])
+
+
+def _next_wave(state: AgentState, update: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Plan steps whose dependencies have all finished. Steps depending on a
+    failed task are recorded as skipped, and steps that can never run
+    (unknown or cyclic dependencies) as errors, so the plan always ends.
+    """
+    results = update["step_results"]
+    while True:
+        pending = [step for step in state["execution_plan"] if step["id"] not in results]
+        ready = [step for step in pending if all(dep in results for dep in step["deps"])]
+        if not pending:
+            return []
+        if not ready:
+            for step in pending:
+                _record(update, step, {"error": f"Unmet dependencies: {', '.join(step['deps'])}"})
+            return []
+
+        wave = []
+        for step in ready:
+            failed = [dep for dep in step["deps"] if _failed(results[dep])]
+            if failed:
+                _record(update, step, {"error": f"Skipped: {', '.join(failed)} failed"})
+            else:
+                wave.append(step)
+        if wave:
+            return wave
+
+
+def _start_wave(state: AgentState, update: Dict[str, Any], task_map: dict) -> List[Dict[str, Any]]:
+    """Return the steps to run now; unknown tasks are recorded as errors"""
+    wave = []
+    for step in _next_wave(state, update):
+        if not task_map.get(step["task"]):
+            logger.warning("Unknown task: %s", step["task"])
+            _record(update, step, {"error": f"Unknown task: {step['task']}"})
+            continue
+        logger.info("Running task: %s", step["id"])
+        log_event(update, "execute", f"Executing: {step['id']}", task=step["id"])
+        wave.append(step)
+    return wave
+
+
+def _run_task(step: Dict[str, Any], state: AgentState):
     try:
-        tool_func = TASK_MAP.get(current_task)
-        
-        if not tool_func:
-            print(f"[EXECUTOR] Unknown task: {current_task}")
-            state["step_results"][current_task] = {"error": f"Unknown task: {current_task}"}
-            state["current_step"] += 1
-            return state
-        
-        if current_task == "code_explanation":
-            content = state.get("extracted_content", "")
-            query = state["user_prompt"]
-            result = tool_func(content)
-
-        elif current_task == "summarize":
-            content = state.get("extracted_content", "")
-            query = state["user_prompt"]
-            result = tool_func(content)
-
-        elif current_task == "sentiment_analysis":
-            content = state.get("extracted_content", "")
-            query = state["user_prompt"]
-            result = tool_func(content)
-
-        elif current_task == "conversational_response":
-            # content = state.get("extracted_content", "")
-            query = state["user_prompt"]
-            result = tool_func(query)
-            print(result)
-        
-        elif current_task == "transcribe":
-            content = state.get("extracted_content", "").splitlines()
-            # query = state["user_prompt"]
-            result = "Below is the transcribed of the given data:\n"+content
-            # print(result)
-
-        else:
-            content = state.get("extracted_content", "")
-            query = state["user_prompt"]
-            result = content
-        
-        # print(result)
-        state["step_results"] = result
-        print(state["step_results"])
-        print(f"[EXECUTOR] Task completed: {current_task}")
-    
+        if step["task"] in LLM_TASKS:
+            return TASK_MAP[step["task"]](_tool_input(step["task"], state))
+        return _local_result(TASK_MAP[step["task"]], state)
+    except Exception as e:
+        return {"error": str(e)}
 
+
+async def _arun_task(step: Dict[str, Any], state: AgentState, stream: bool):
+    # Each gathered task has its own context; tokens of concurrent tasks
+    # would interleave, so only a task running alone streams them
+    if not stream:
+        set_token_sink(None)
+    try:
+        if step["task"] in LLM_TASKS:
+            return await ASYNC_TASK_MAP[step["task"]](_tool_input(step["task"], state))
+        return _local_result(ASYNC_TASK_MAP[step["task"]], state)
     except Exception as e:
-        print(f"[EXECUTOR] Task failed: {str(e)}")
-        state["step_results"][current_task] = {"error": str(e)}
-        state["logs"].append(f"ERROR in {current_task}: {str(e)}")
-    
-    state["current_step"] += 1
-    return state
\ No newline at end of file
+        return {"error": str(e)}
+
+
+def process(state: AgentState) -> Dict[str, Any]:
+    """Run the next wave of ready plan steps, concurrently in threads"""
+    update = _new_update(state)
+    wave = _start_wave(state, update, TASK_MAP)
+    if len(wave) == 1:
+        results = [_run_task(wave[0], state)]
+    elif wave:
+        with ThreadPoolExecutor(max_workers=len(wave)) as pool:
+            futures = [pool.submit(copy_context().run, _run_task, step, state) for step in wave]
+            results = [future.result() for future in futures]
+    else:
+        results = []
+
+    for step, result in zip(wave, results):
+        _record(update, step, result)
+    return update
+
+
+async def aprocess(state: AgentState) -> Dict[str, Any]:
+    """Run the next wave of ready plan steps concurrently"""
+    update = _new_update(state)
+    wave = _start_wave(state, update, ASYNC_TASK_MAP)
+    results = await asyncio.gather(*(_arun_task(step, state, len(wave) == 1) for step in wave))
+
+    for step, result in zip(wave, results):
+        _record(update, step, result)
+    return update
+
+
+def task_results(state: AgentState):
+    """
+    What a run returns to the caller: the result itself for a one-task
+    plan, otherwise the results keyed by task
+    """
+    results = state["step_results"]
+    if len(results) == 1:
+        return next(iter(results.values()))
+    return results
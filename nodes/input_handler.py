@@ -1,13 +1,20 @@
 import os
+import re
+import time
 from graph.state import AgentState
-from tools import ocr_tool, pdf_parser, asr
+from tools import ocr_tool, pdf_parser, asr, extraction_cache, metrics
+from tools.log import get_logger, log_event
+from tools.file_source import Source
+from tools.offload import run_blocking
 
 from typing import TypedDict, Optional, List, Dict, Any
 
+logger = get_logger("input_handler")
 
-def detect_input_type(user_prompt: str, input_data: Optional[str]) -> str:
-    # Check if it's a file
-    if input_data and os.path.isfile(input_data):
+
+def detect_input_type(user_prompt: str, input_data: Optional[str], input_file=None) -> str:
+    # Check if it's a file (a path, or an upload whose name is in input_data)
+    if input_data and (input_file is not None or os.path.isfile(input_data)):
         ext = os.path.splitext(input_data)[1].lower()
         
         if ext in ['.jpg', '.jpeg', '.png']:
@@ -29,33 +36,98 @@ def detect_input_type(user_prompt: str, input_data: Optional[str]) -> str:
     return "text"
 
 
-def extract_content(input_type: str, input_data: str) -> Dict[str, Any]:
+# Bump the version when an extractor's output changes so stale cache
+# entries are no longer hit.
+EXTRACTOR_VERSIONS = {
+    "image": "2",
+    "pdf": "3",
+    "audio": "3",
+}
+
+
+def extract_content(input_type: str, input_data: str, input_file=None,
+                    asr_model: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Extract content, reusing cached results for files seen before.
+    Files are read from `input_file` when given, else from the path in
+    `input_data`. `asr_model` picks the Whisper size for audio. Cacheable
+    results carry their entry's key as "cache_key".
+    """
+    source = input_file if input_file is not None else input_data
+    
+    if input_type not in EXTRACTOR_VERSIONS or not extraction_cache.enabled():
+        return _timed_extract(input_type, input_data, source, asr_model)
+    
+    version = EXTRACTOR_VERSIONS[input_type]
+    if input_type == "audio":
+        # Transcripts from different model sizes are cached separately
+        version = f"{version}-{asr.model_id(asr_model)}"
+    key = extraction_cache.content_key(source, input_type, version)
+    cached = extraction_cache.get(key)
+    metrics.record_cache("extraction", cached is not None)
+    if cached is not None:
+        logger.info("Extraction cache hit: %s", key)
+        return {**cached, "cache_key": key}
+    
+    result = _timed_extract(input_type, input_data, source, asr_model)
+    if result["content"] and extraction_cache.put(key, result):
+        result["cache_key"] = key
+    return result
+
+
+def restore_extraction(snapshot: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    {content, metadata} extracted for a run paused on a clarification, or
+    None when it is gone (evicted from the cache, or too large to keep inline)
+    """
+    key = snapshot.get("extraction_key")
+    if key:
+        return extraction_cache.get(key)
+    return snapshot.get("extracted")
+
+
+def _timed_extract(input_type: str, input_data: str, source: Source,
+                   asr_model: Optional[str] = None) -> Dict[str, Any]:
+    start = time.perf_counter()
+    result = _extract(input_type, input_data, source, asr_model)
+    metrics.record_extraction(
+        input_type, time.perf_counter() - start, len(result["content"].encode("utf-8"))
+    )
+    return result
+
+
+def _extract(input_type: str, input_data: str, source: Source,
+             asr_model: Optional[str] = None) -> Dict[str, Any]:
     """Extract content based on input type"""
     
     if input_type == "image":
-        result = ocr_tool.extract(input_data)
+        result = ocr_tool.extract(source)
         return {
             "content": result["text"] or "",
             "metadata": {"ocr_confidence": result["confidence"]}
         }
     
     elif input_type == "pdf":
-        result = pdf_parser.extract_pdf(input_data)
+        result = pdf_parser.extract_pdf(source)
         return {
             "content": result["text"] or "",
             "metadata": {"confidence": result["confidence"], "pages": result["pages"]}
         }
     
     elif input_type == "audio":
-        result = asr.transcribe(input_data, "Transcribe this audio")
+        result = asr.transcribe(source, model=asr_model)
+        # Segments repeat the whole transcript, so they stay in the result
+        # (and the extraction cache) rather than in state metadata, which is
+        # logged, formatted into the output and kept in session history
         return {
             "content": result["text"] or "",
-            "metadata": {"duration": result["duration"]}
+            "metadata": {"duration": result["duration"], "segments": len(result["segments"])},
+            "segments": result["segments"]
         }
     
     elif input_type == "youtube":
         from tools.youtube_transcribe import get_transcript
-        print(f"YT Link is in this format: {input_data}")
+        logger.debug("YouTube link: %s", input_data)
         result = get_transcript(input_data)
         return {
             "content": result["transcript"] if result["success"] else "",
@@ -69,41 +141,84 @@ def extract_content(input_type: str, input_data: str) -> Dict[str, Any]:
         }
 
 
-def process(state: AgentState) -> AgentState:
-    print("\n[INPUT HANDLER] Processing input...")
+def _youtube_url(prompt: str) -> str:
+    match = re.search(
+        r"(https?:\/\/(?:www\.)?(?:youtube\.com\/watch\?[^\s]+|youtu\.be\/[^\s]+))",
+        prompt
+    )
+    return match.group(1)
+
+
+def detect(state: AgentState) -> Dict[str, Any]:
+    """
+    Detect the input type (from the file name or prompt, no extraction)
+    and normalise input_data, so intent detection can start right away
+    """
+    update = {"logs": []}
+    input_type = detect_input_type(
+        state["user_prompt"], state.get("input_data"), state.get("input_file")
+    )
+    update["input_type"] = input_type
+    
+    logger.info("Detected input type: %s", input_type)
+    log_event(update, "detect", f"Input type: {input_type}", input_type=input_type)
     
-    # Step 1: Detect input type
-    input_type = detect_input_type(state["user_prompt"], state.get("input_data"))
-    state["input_type"] = input_type
+    if input_type == "youtube":
+        update["input_data"] = _youtube_url(state["user_prompt"])
     
-    print(f"[INPUT HANDLER] Detected input type: {input_type}")
-    state["logs"].append(f"Input type: {input_type}")
+    return update
+
+
+def _apply_result(update: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+    update["extracted_content"] = result["content"]
+    update["extraction_metadata"] = result["metadata"]
+    update["extraction_key"] = result.get("cache_key")
+    
+    logger.info("Extracted %d characters", len(result["content"]))
+    log_event(update, "input", f"Extracted content: {len(result['content'])} chars",
+              chars=len(result["content"]))
+    
+    if result["metadata"]:
+        logger.debug("Metadata: %s", result["metadata"])
+        log_event(update, "input", f"Metadata: {result['metadata']}", metadata=result["metadata"])
+    
+    return update
+
+
+def _extraction_failed(state: AgentState, update: Dict[str, Any], e: Exception) -> Dict[str, Any]:
+    logger.error("Extraction failed: %s", e)
+    log_event(update, "input", f"ERROR: {str(e)}", error=str(e))
+    update["extracted_content"] = state["user_prompt"]
+    return update
+
+
+def _extract_args(state: AgentState) -> tuple:
+    return (
+        state["input_type"], state.get("input_data", state["user_prompt"]),
+        state.get("input_file"), state.get("asr_model")
+    )
+
+
+def process(state: AgentState) -> Dict[str, Any]:
+    """Extract the content of an input whose type `detect` has set"""
+    logger.debug("Processing input...")
+    update = {"logs": []}
     
-    # Step 2: Extract content
     try:
-        if input_type == "youtube":
-            import re
-            match = re.search(
-                r"(https?:\/\/(?:www\.)?(?:youtube\.com\/watch\?[^\s]+|youtu\.be\/[^\s]+))",
-                state["user_prompt"]
-            )
-            state["input_data"] = match.group(1)
-            result = extract_content(input_type, state.get("input_data", state["user_prompt"]))
-
-        result = extract_content(input_type, state.get("input_data", state["user_prompt"]))
-        state["extracted_content"] = result["content"]
-        state["extraction_metadata"] = result["metadata"]
-        
-        print(f"[INPUT HANDLER] Extracted {len(result['content'])} characters")
-        state["logs"].append(f"Extracted content: {len(result['content'])} chars")
-        
-        if result["metadata"]:
-            print(f"[INPUT HANDLER] Metadata: {result['metadata']}")
-            state["logs"].append(f"Metadata: {result['metadata']}")
+        return _apply_result(update, extract_content(*_extract_args(state)))
     
     except Exception as e:
-        print(f"[INPUT HANDLER] Extraction failed: {str(e)}")
-        state["logs"].append(f"ERROR: {str(e)}")
-        state["extracted_content"] = state["user_prompt"]
+        return _extraction_failed(state, update, e)
+
+
+async def aprocess(state: AgentState) -> Dict[str, Any]:
+    """Async variant: blocking extraction runs on the bounded extraction pool"""
+    logger.debug("Processing input...")
+    update = {"logs": []}
+    
+    try:
+        result = await run_blocking(extract_content, *_extract_args(state))
+        return _apply_result(update, result)
     
-    return state
\ No newline at end of file
+    except Exception as e:
+        return _extraction_failed(state, update, e)
@@ -1,6 +1,11 @@
 from graph.state import AgentState
-from tools.llm_inference import inference
+from tools.llm_inference import inference, ainference
+from tools.cache import TTLCache
+from tools.log import get_logger, log_event
 import json
+import os
+import re
+from typing import Any, Dict, Optional
 
 INTENT_DETECTION_PROMPT = """
 You are an intent detection system.
@@ -8,7 +13,7 @@ You are an intent detection system.
 User Query: {query}
 Input Type: {input_type}
 
-Choose one intent:
+Choose one or more intents:
 - extract_text
 - summarize
 - sentiment
@@ -19,13 +24,15 @@ Choose one intent:
 - ambiguous
 
 Rules:
-- If unclear, vague, or multiple intents → ambiguous
+- List every task the query asks for in "intents" (e.g. "summarize and give me the sentiment" → ["summarize", "sentiment"]); "intent" is the main one
+- If unclear or vague → ambiguous
 - If confidence < 0.7 → ambiguous
 - Ask for clarification ONLY if the query itself is unclear
 
 Return ONLY this JSON:
 {{
   "intent": "...",
+  "intents": ["..."],
   "confidence": 0.0,
   "reasoning": "...",
   "needs_clarification": false,
@@ -36,48 +43,237 @@ Return ONLY this JSON:
 
 
 
-def process(state: AgentState) -> AgentState:    
-    print("\n[INTENT DETECTOR] Analyzing intent...")
+# Local fast path: (intent, pattern, confidence, input types or None for any).
+# A prompt whose matching rules are all confident enough (several only if
+# they can be combined) is answered without an LLM call; anything else
+# falls through to the model.
+INTENT_RULES = [
+    ("summarize", r"\b(summari[sz]e|summary|tl;?dr|key (points|takeaways)|gist)\b", 0.9, None),
+    ("sentiment", r"\b(sentiment|tone|mood|positive or negative|negative or positive)\b", 0.9, None),
+    ("code_explain", r"\b(explain|analy[sz]e|review|debug)\b.*\b(code|function|program|snippet|script|algorithm)\b", 0.9, None),
+    ("code_explain", r"^\s*explain( this| it)?\s*[.!?]*\s*$", 0.8, {"image"}),
+    ("extract_text", r"\b(extract|ocr|read out|get)\b.*\btext\b", 0.85, {"image", "pdf"}),
+    ("transcribe", r"\b(transcribe|transcript|transcription)\b", 0.85, {"audio", "youtube"}),
+]
+
+# Plain questions and greetings with no attached content
+CONVERSATIONAL_PATTERN = r"^\s*(hi|hello|hey|thanks|thank you|what|who|why|how|when|where|can you|could you|tell me)\b"
+
+# Prompts the tool rules can't judge: a negation may flip a keyword ("don't
+# summarize"), and a question may be about the task rather than ask for it
+# ("how do I summarize a book?"); both are left to the model
+NEGATION_PATTERN = r"n't\b|\b(not|no|never|without|instead of|rather than|except|skip)\b"
+QUESTION_PATTERN = r"\?\s*$|^\s*(what|who|why|how|when|where|which|is|are|does|do|can|could|should|would)\b"
+
+# Confidence bonus for intents that are likely given the input type
+INPUT_TYPE_PRIORS = {
+    "image": {"code_explain": 0.05, "extract_text": 0.05},
+    "audio": {"transcribe": 0.1},
+    "youtube": {"youtube_transcript": 0.1},
+    "text": {"conversational": 0.05},
+}
+
+RULE_CONFIDENCE_THRESHOLD = 0.85
+
+# Intents one prompt may ask for together ("transcribe and summarize")
+COMBINABLE_INTENTS = {"summarize", "sentiment", "code_explain", "extract_text", "transcribe"}
+
+# Parsed LLM intent results, keyed by normalized query and input type.
+# Set INTENT_CACHE_PATH to persist them in SQLite across restarts/workers.
+intent_cache = TTLCache(
+    "intent",
+    maxsize=int(os.getenv("INTENT_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("INTENT_CACHE_TTL", "3600")),
+    path=os.getenv("INTENT_CACHE_PATH") or None
+)
+
+logger = get_logger("intent_detector")
+
+
+def _cache_key(query: str, state: AgentState) -> str:
+    normalized = " ".join(query.lower().split()).rstrip(" .!?")
+    input_kind = state.get("input_type") or "text"
+    if not _has_content(state):
+        input_kind += "-empty"
+    return f"{input_kind}:{normalized}"
+
+
+def _has_content(state: AgentState) -> bool:
+    # Text input is the content itself, so without it there's nothing to analyse
+    return state.get("input_type") not in (None, "", "text") or bool(state.get("input_data"))
+
+
+def rule_based_intent(prompt: str, input_type: str, has_content: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    Classify obvious prompts locally; returns None when unsure. Tool rules
+    only fire for commands about attached content (`has_content`).
+    """
+    text = prompt.lower()
+    if re.search(NEGATION_PATTERN, text):
+        return None
     
-    if state.get("user_clarification"):
-        print("[INTENT DETECTOR] Using user clarification")
-        prompt = state["user_clarification"]
-    else:
-        prompt = state["user_prompt"]
+    matches = {}
+    tool_rules = has_content and not re.search(QUESTION_PATTERN, text)
+    for intent, pattern, confidence, input_types in INTENT_RULES:
+        if not tool_rules:
+            break
+        if input_types is not None and input_type not in input_types:
+            continue
+        if re.search(pattern, text):
+            matches[intent] = max(confidence, matches.get(intent, 0.0))
+    
+    if not matches and input_type == "text" and not has_content and re.match(CONVERSATIONAL_PATTERN, text):
+        matches["conversational"] = 0.8
     
-    detection_prompt = INTENT_DETECTION_PROMPT.format(
-        query=prompt,
+    # Several candidate intents are fine when they can be run together;
+    # otherwise the prompt really is ambiguous
+    if not matches or (len(matches) > 1 and not set(matches) <= COMBINABLE_INTENTS):
+        return None
+    
+    intents = []
+    confidences = []
+    for intent, confidence in matches.items():
+        if intent == "transcribe" and input_type == "youtube":
+            intent = "youtube_transcript"
+        confidence = min(1.0, confidence + INPUT_TYPE_PRIORS.get(input_type, {}).get(intent, 0.0))
+        if confidence < RULE_CONFIDENCE_THRESHOLD:
+            return None
+        intents.append(intent)
+        confidences.append(confidence)
+    
+    return {
+        "intent": intents[0],
+        "intents": intents,
+        "confidence": min(confidences),
+        "reasoning": "Matched local intent rule",
+        "needs_clarification": False,
+        "clarification_question": None
+    }
+
+
+def _query(state: AgentState) -> str:
+    if state.get("user_clarification"):
+        logger.info("Using user clarification")
+        return state["user_clarification"]
+    return state["user_prompt"]
+
+
+def _detection_prompt(query: str, state: AgentState) -> str:
+    return INTENT_DETECTION_PROMPT.format(
+        query=query,
         # content=state.get("extracted_content", "")[:100],
         input_type=state.get("input_type", "text")
     )
+
+
+REQUIRED_KEYS = ("intent", "confidence", "needs_clarification")
+
+
+def _parse(raw: str) -> Dict[str, Any]:
+    """Parse and check the model's reply, so only usable results are cached"""
+    match = re.search(r'\{.*\}', raw, re.DOTALL)
+    if not match:
+        raise ValueError("No JSON found in model output")
+    json_str = match.group()
+    result = json.loads(json_str)
+    
+    if not isinstance(result, dict):
+        raise ValueError("Intent result is not a JSON object")
+    missing = [key for key in REQUIRED_KEYS if key not in result]
+    if missing:
+        raise ValueError(f"Intent result is missing {', '.join(missing)}")
+    if not isinstance(result["confidence"], (int, float)):
+        raise ValueError("Intent confidence is not a number")
+    intents = result.setdefault("intents", [result["intent"]])
+    if not isinstance(intents, list) or not all(isinstance(intent, str) for intent in intents):
+        raise ValueError("Intent result's intents is not a list of names")
+    return result
+
+
+def _fast_path(query: str, state: AgentState, update: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Resolve intent from local rules or the cache, without an LLM call"""
+    input_type = state.get("input_type") or "text"
+    result = rule_based_intent(query, input_type, _has_content(state))
+    if result:
+        logger.info("Resolved by local rules")
+        log_event(update, "intent", "Intent resolved locally", source="rules")
+        return result
+    
+    result = intent_cache.get(_cache_key(query, state))
+    if result:
+        logger.info("Resolved from cache")
+        log_event(update, "intent", "Intent resolved from cache", source="cache")
+    return result
+
+
+def _remember(query: str, state: AgentState, result: Dict[str, Any]) -> Dict[str, Any]:
+    intent_cache.set(_cache_key(query, state), result)
+    return result
+
+
+def _apply_result(update: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+    update["detected_intent"] = result["intent"]
+    # Results cached before multi-intent support only carry "intent"
+    update["detected_intents"] = result.get("intents") or [result["intent"]]
+    update["intent_confidence"] = result["confidence"]
+    update["needs_clarification"] = result["needs_clarification"]
+    update["clarification_question"] = result.get("clarification_question")
+    
+    intents = ", ".join(update["detected_intents"])
+    logger.info(
+        "Intent: %s (confidence: %.2f, needs clarification: %s)",
+        intents, result["confidence"], result["needs_clarification"]
+    )
+    log_event(
+        update, "intent", f"Detected intent: {intents} ({result['confidence']:.2f})",
+        intent=result["intent"], intents=update["detected_intents"], confidence=result["confidence"]
+    )
+    
+    if result["needs_clarification"]:
+        logger.info("Question: %s", result["clarification_question"])
+        log_event(update, "intent", f"Asking: {result['clarification_question']}",
+                  question=result["clarification_question"])
+    
+    return update
+
+
+def _detection_failed(update: Dict[str, Any], e: Exception) -> Dict[str, Any]:
+    logger.error("Intent detection failed: %s", e)
+    update["needs_clarification"] = True
+    update["clarification_question"] = "What would you like me to do with this content?"
+    return update
+
+
+def process(state: AgentState) -> Dict[str, Any]:
+    """
+    Detect the intent from the prompt and input type only, so it can run
+    while the content is still being extracted. Returns a partial update.
+    """
+    logger.debug("Analyzing intent...")
+    update = {"logs": []}
     
     try:
-        raw = inference(user_prompt=detection_prompt)
-        import re
-        match = re.search(r'\{.*\}', raw, re.DOTALL)
-        if not match:
-            raise ValueError("No JSON found in model output")
-        json_str = match.group()
-        result = json.loads(json_str)
-        # result = json.loads(match)
-        # print(detection_prompt)
-        state["detected_intent"] = result["intent"]
-        state["intent_confidence"] = result["confidence"]
-        state["needs_clarification"] = result["needs_clarification"]
-        state["clarification_question"] = result.get("clarification_question")
-        
-        print(f"[INTENT DETECTOR] Intent: {result['intent']} (confidence: {result['confidence']:.2f})")
-        print(f"[INTENT DETECTOR] Needs clarification: {result['needs_clarification']}")
-        
-        state["logs"].append(f"Detected intent: {result['intent']} ({result['confidence']:.2f})")
-        
-        if result["needs_clarification"]:
-            print(f"[INTENT DETECTOR] Question: {result['clarification_question']}")
-            state["logs"].append(f"Asking: {result['clarification_question']}")
+        query = _query(state)
+        result = _fast_path(query, state, update)
+        if result is None:
+            result = _remember(query, state, _parse(inference(user_prompt=_detection_prompt(query, state))))
+        return _apply_result(update, result)
     
     except Exception as e:
-        print(f"[INTENT DETECTOR] Error: {str(e)}")
-        state["needs_clarification"] = True
-        state["clarification_question"] = "What would you like me to do with this content?"
+        return _detection_failed(update, e)
+
+
+async def aprocess(state: AgentState) -> Dict[str, Any]:
+    logger.debug("Analyzing intent...")
+    update = {"logs": []}
     
-    return state
\ No newline at end of file
+    try:
+        query = _query(state)
+        result = _fast_path(query, state, update)
+        if result is None:
+            raw = await ainference(user_prompt=_detection_prompt(query, state))
+            result = _remember(query, state, _parse(raw))
+        return _apply_result(update, result)
+    
+    except Exception as e:
+        return _detection_failed(update, e)
@@ -1,7 +1,12 @@
+from typing import Any, Dict
+
 from graph.state import AgentState
+from tools.log import get_logger, log_event
+
+logger = get_logger("output_formatter")
 
-def process(state: AgentState) -> AgentState:    
-    print("\n[OUTPUT FORMATTER] Formatting results...")
+def process(state: AgentState) -> Dict[str, Any]:
+    logger.debug("Formatting results...")
     
     output_parts = []
     
@@ -31,41 +36,23 @@ def process(state: AgentState) -> AgentState:
     output_parts.append("TASK RESULTS:")
     output_parts.append("")
     
-    # for task, result in state["step_results"].items():
-    #     output_parts.append(f"{task.upper().replace('_', ' ')}")
-    #     output_parts.append("-" * 80)
+    for task, result in state["step_results"].items():
+        output_parts.append(f"{task.upper().replace('_', ' ')}")
+        output_parts.append("-" * 80)
         
-    #     if isinstance(result, dict):
-    #         if "error" in result:
-    #             output_parts.append(f"Error: {result['error']}")
-    #         else:
-    #             for key, value in result.items():
-    #                 if key != "text":  # Don't repeat full text
-    #                     output_parts.append(f"  {key}: {value}")
-    #     else:
-    #         output_parts.append(str(result))
-        
-    #     output_parts.append("")
-
-    # for result in state["step_results"]:
-    result = state["step_results"]
-    output_parts.append(f"Task Output")
-    output_parts.append("-" * 80)
-    
-    if isinstance(result, dict):
-        if "error" in result:
-            output_parts.append(f"Error: {result['error']}")
+        if isinstance(result, dict):
+            if "error" in result:
+                output_parts.append(f"Error: {result['error']}")
+            else:
+                for key, value in result.items():
+                    if key != "text":  # Don't repeat full text
+                        output_parts.append(f"  {key}: {value}")
         else:
-            for key, value in result.items():
-                if key != "text":  # Don't repeat full text
-                    output_parts.append(f"  {key}: {value}")
-    else:
-        output_parts.append(str(result))
-    
-    output_parts.append("")
+            output_parts.append(str(result))
         
+        output_parts.append("")
     
-    state["final_output"] = "\n".join(output_parts)
-    state["logs"].append("Output formatted successfully")
+    update = {"final_output": "\n".join(output_parts), "logs": []}
+    log_event(update, "format", "Output formatted successfully")
     
-    return state
+    return update
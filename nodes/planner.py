@@ -1,33 +1,59 @@
+from typing import Any, Dict, List
+
 from graph.state import AgentState
-from tools.llm_inference import inference
-
-def process(state: AgentState) -> AgentState:
-    print("\n[PLANNER] Creating execution plan...")
-
-    intent=state["detected_intent"]
-    
-    try:
-        plan = intent
-       
-        print(plan)
-        state["execution_plan"] = plan
-        state["current_step"] = 0
-        
-        print(f"[PLANNER] Plan: {' → '.join(plan)}")
-        state["logs"].append(f"Execution plan: {' → '.join(plan)}")
-    
-    except Exception as e:
-        print(f"[PLANNER] Planning failed: {str(e)}")
-        intent = state["detected_intent"]
-        if intent == "summarize":
-            state["execution_plan"] = ["summarize"]
-        elif intent == "sentiment":
-            state["execution_plan"] = ["sentiment_analysis"]
-        elif intent == "code_explain":
-            state["execution_plan"] = ["code_explanation"]
-        else:
-            state["execution_plan"] = ["conversational_response"]
-        
-        state["current_step"] = 0
-    
-    return state
\ No newline at end of file
+from tools.log import get_logger, log_event
+
+logger = get_logger("planner")
+
+# Executor task for each detected intent
+INTENT_TASKS = {
+    "extract_text": "extract_text",
+    "transcribe": "transcribe",
+    "youtube_transcript": "youtube_transcript",
+    "summarize": "summarize",
+    "sentiment": "sentiment_analysis",
+    "code_explain": "code_explanation",
+    "conversational": "conversational_response",
+}
+
+# Tasks that hand back the extracted text; when one is planned, the
+# analysis tasks wait for it (and are skipped if it fails)
+SOURCE_TASKS = {"extract_text", "transcribe", "youtube_transcript"}
+
+
+def build_plan(intents: List[str]) -> List[Dict[str, Any]]:
+    """
+    Turn intents into a task DAG: [{"id", "task", "deps"}]. Tasks without
+    dependencies on each other are run concurrently by the executor.
+    """
+    tasks = []
+    for intent in intents:
+        task = INTENT_TASKS.get(intent, "conversational_response")
+        if task not in tasks:
+            tasks.append(task)
+
+    sources = [task for task in tasks if task in SOURCE_TASKS]
+    return [
+        {"id": task, "task": task, "deps": [] if task in SOURCE_TASKS else list(sources)}
+        for task in tasks
+    ]
+
+
+def describe_plan(plan: List[Dict[str, Any]]) -> str:
+    return ", ".join(
+        f"{step['id']} (after {', '.join(step['deps'])})" if step["deps"] else step["id"]
+        for step in plan
+    )
+
+
+def process(state: AgentState) -> Dict[str, Any]:
+    logger.debug("Creating execution plan...")
+
+    intents = state.get("detected_intents") or [state["detected_intent"]]
+    plan = build_plan(intents)
+    update = {"execution_plan": plan, "current_step": 0, "logs": []}
+
+    logger.info("Plan: %s", describe_plan(plan))
+    log_event(update, "plan", f"Execution plan: {describe_plan(plan)}", plan=plan)
+
+    return update
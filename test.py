@@ -23,7 +23,9 @@ def run_test(user_prompt: str, input_data: str = None):
         input_type="",
         extracted_content=None,
         extraction_metadata=None,
+        extraction_key=None,
         detected_intent=None,
+        detected_intents=[],
         intent_confidence=0.0,
         needs_clarification=False,
         clarification_question=None,
@@ -59,7 +61,7 @@ def run_test(user_prompt: str, input_data: str = None):
         print("EXECUTION LOGS")
         print("=" * 80)
         for log in final_state["logs"]:
-            print(f"  • {log}")
+            print(f"  • {log['message']}")
         
         return final_state
     
@@ -1,21 +1,183 @@
-from openai import OpenAI
+import io
 import os
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from openai import OpenAI
+from tools import whisper_models
+from tools.file_source import Source, as_path, describe
+from tools.log import get_logger
+
+# "local" runs openai-whisper on this machine (offline, CPU is fine);
+# "openai" sends the chunks to the OpenAI transcription API.
+ASR_BACKEND = os.getenv("ASR_BACKEND", "local")
+ASR_LANGUAGE = os.getenv("ASR_LANGUAGE") or None
+# Chunks are at most this long (Whisper's window is 30s) and are cut at
+# the quietest point of the last ASR_SEARCH_SECONDS before the limit
+ASR_CHUNK_SECONDS = float(os.getenv("ASR_CHUNK_SECONDS", "30"))
+ASR_SEARCH_SECONDS = 5.0
+# Chunks decoded together by the local model / sent at once to the API
+ASR_MAX_PARALLEL = int(os.getenv("ASR_MAX_PARALLEL", "4"))
+# Chunks whose loudest frame is below this RMS are skipped as silence
+ASR_SILENCE_RMS = float(os.getenv("ASR_SILENCE_RMS", "0.01"))
+
+SAMPLE_RATE = 16000
+FRAME_SAMPLES = 480  # 30 ms
+
+_openai_client = None
+logger = get_logger("asr")
+
+
+def model_id(model: Optional[str] = None) -> str:
+    """The model that will actually transcribe, e.g. for cache keys"""
+    if ASR_BACKEND == "openai":
+        return "whisper-1"
+    return model or whisper_models.WHISPER_MODEL
+
+
+def _get_openai_client() -> OpenAI:
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = OpenAI()
+    return _openai_client
+
+
+def _load_audio(source: Source):
+    """Decode any ffmpeg-readable file to 16 kHz mono float32 samples"""
+    import whisper
+    suffix = os.path.splitext(describe(source))[1]
+    with as_path(source, suffix) as path:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Audio file not found: {path}")
+        return whisper.load_audio(path, sr=SAMPLE_RATE)
+
+
+def _frame_rms(audio):
+    usable = len(audio) - len(audio) % FRAME_SAMPLES
+    frames = audio[:usable].reshape(-1, FRAME_SAMPLES)
+    return ((frames ** 2).mean(axis=1)) ** 0.5
+
+
+def split_on_silence(audio, chunk_seconds: float = ASR_CHUNK_SECONDS) -> List[Tuple[int, int]]:
+    """
+    Split audio into (start, end) sample ranges of at most `chunk_seconds`,
+    cutting at the quietest frame near each limit so words aren't split
+    """
+    rms = _frame_rms(audio)
+    max_frames = int(chunk_seconds * SAMPLE_RATE / FRAME_SAMPLES)
+    search_frames = int(ASR_SEARCH_SECONDS * SAMPLE_RATE / FRAME_SAMPLES)
+
+    chunks = []
+    start = 0
+    while start < len(rms):
+        limit = start + max_frames
+        if limit >= len(rms):
+            chunks.append((start * FRAME_SAMPLES, len(audio)))
+            break
+        lo = max(start + 1, limit - search_frames)
+        cut = lo + int(rms[lo:limit].argmin()) + 1
+        chunks.append((start * FRAME_SAMPLES, cut * FRAME_SAMPLES))
+        start = cut
+
+    return [
+        (s, e) for s, e in chunks
+        if e > s and float(_frame_rms(audio[s:e]).max(initial=0)) >= ASR_SILENCE_RMS
+    ]
+
+
+def _decode_local(model_name: str, chunks: list, prompt: Optional[str]) -> List[str]:
+    """Decode chunks in batches of ASR_MAX_PARALLEL in one forward pass each"""
+    import torch
+    import whisper
+
+    model = whisper_models.get(model_name)
+    options = whisper.DecodingOptions(
+        language=ASR_LANGUAGE, prompt=prompt, fp16=False, without_timestamps=True
+    )
+
+    texts = []
+    for i in range(0, len(chunks), ASR_MAX_PARALLEL):
+        batch = chunks[i:i + ASR_MAX_PARALLEL]
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(chunk), model.dims.n_mels)
+            for chunk in batch
+        ]).to(model.device)
+        with whisper_models.decode_lock(model_name):
+            results = model.decode(mels, options)
+        for result in results:
+            # Whisper's own hallucination guard for near-silent chunks
+            if result.no_speech_prob > 0.6 and result.avg_logprob < -1:
+                texts.append("")
+            else:
+                texts.append(result.text.strip())
+    return texts
+
+
+def _wav_bytes(chunk) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes((chunk.clip(-1, 1) * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def _transcribe_api_chunk(chunk, prompt: Optional[str]) -> str:
+    kwargs = {"language": ASR_LANGUAGE} if ASR_LANGUAGE else {}
+    if prompt:
+        kwargs["prompt"] = prompt
+    text = _get_openai_client().audio.transcriptions.create(
+        file=("chunk.wav", _wav_bytes(chunk)),
+        model="whisper-1",
+        response_format="text",
+        **kwargs
+    )
+    return text.strip()
+
+
+def _decode_api(chunks: list, prompt: Optional[str]) -> List[str]:
+    with ThreadPoolExecutor(max_workers=ASR_MAX_PARALLEL) as pool:
+        return list(pool.map(lambda chunk: _transcribe_api_chunk(chunk, prompt), chunks))
+
+
+def transcribe(source: Source, prompt: Optional[str] = None,
+               model: Optional[str] = None) -> Dict:
+    """
+    Transcribe an audio path or file object. Long recordings are split at
+    silences and the chunks transcribed concurrently. Returns the stitched
+    text, the duration in seconds and per-chunk timestamped segments.
+    `model` picks the local Whisper size (see whisper_models.WHISPER_MODELS).
+    """
+    logger.info("Transcribing: %s (%s, %s)", describe(source), ASR_BACKEND, model_id(model))
 
-client = OpenAI()
+    audio = _load_audio(source)
+    duration = len(audio) / SAMPLE_RATE
+    ranges = split_on_silence(audio)
+    chunks = [audio[s:e] for s, e in ranges]
+    logger.info("%.1fs of audio in %d chunks", duration, len(chunks))
 
-def transcribe_audio(audio_path: str) -> str:
-    if not os.path.exists(audio_path):
-        raise FileNotFoundError(f"Audio file not found: {audio_path}")
+    if not chunks:
+        texts = []
+    elif ASR_BACKEND == "local":
+        texts = _decode_local(model_id(model), chunks, prompt)
+    elif ASR_BACKEND == "openai":
+        texts = _decode_api(chunks, prompt)
+    else:
+        raise ValueError(f"Unknown ASR_BACKEND: {ASR_BACKEND}")
 
-    with open(audio_path, "rb") as audio_file:
-        transcription = client.audio.transcriptions.create(
-            file=audio_file,
-            model="whisper-1",
-            response_format="text"   # ensures plain text output
-        )
+    segments = [
+        {"start": round(s / SAMPLE_RATE, 2), "end": round(e / SAMPLE_RATE, 2), "text": text}
+        for (s, e), text in zip(ranges, texts) if text
+    ]
 
-    return transcription
+    return {
+        "text": " ".join(segment["text"] for segment in segments),
+        "duration": round(duration, 2),
+        "segments": segments
+    }
 
 
 if __name__ == "__main__":
-    transcribe_audio("WhatsApp Audio 2025-12-23 at 1.31.22 PM.mp4")
\ No newline at end of file
+    print(transcribe("WhatsApp Audio 2025-12-23 at 1.31.22 PM.mp4"))
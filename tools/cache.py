@@ -0,0 +1,131 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from tools import metrics
+
+# Every cache registers itself so hit/miss counters can be reported together
+_registry: Dict[str, "TTLCache"] = {}
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after `ttl` seconds.
+
+    When `path` is given, entries are also written to a SQLite file so they
+    survive restarts and are shared between worker processes; the file is
+    bounded to `maxsize` entries as well. Values must be JSON-serializable.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, path: Optional[str] = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT, expires REAL, accessed REAL)"
+            )
+            self._db.commit()
+        _registry[name] = self
+
+    def get(self, key: str, default=None) -> Any:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                metrics.record_cache(self.name, True)
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+
+            row = self._db_get(key, now)
+            if row is not None:
+                self._remember(key, *row)
+                self.hits += 1
+                metrics.record_cache(self.name, True)
+                return row[0]
+
+            self.misses += 1
+            metrics.record_cache(self.name, False)
+            return default
+
+    def set(self, key: str, value: Any):
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, value, expires)
+            self._db_set(key, value, expires)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM entries")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _remember(self, key: str, value: Any, expires: float):
+        self._entries[key] = (value, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _db_get(self, key: str, now: float) -> Optional[tuple]:
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT value, expires FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] <= now:
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._db.commit()
+            return None
+        self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        self._db.commit()
+        return json.loads(row[0]), row[1]
+
+    def _db_set(self, key: str, value: Any, expires: float):
+        if self._db is None:
+            return
+        self._db.execute(
+            "INSERT OR REPLACE INTO entries (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), expires, time.time())
+        )
+        # Drop expired rows, then the least recently used beyond maxsize
+        self._db.execute("DELETE FROM entries WHERE expires <= ?", (time.time(),))
+        self._db.execute(
+            "DELETE FROM entries WHERE key IN ("
+            "SELECT key FROM entries ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.maxsize,)
+        )
+        self._db.commit()
+
+
+def all_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: cache.stats() for name, cache in _registry.items()}
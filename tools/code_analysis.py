@@ -1,4 +1,7 @@
-from tools.llm_inference import inference
+from tools.llm_inference import inference, ainference
+from tools.log import get_logger
+
+logger = get_logger("code_analysis")
 
 CODE_ANALYSIS_PROMPT = """
 Analyze this code and provide:
@@ -19,9 +22,16 @@ def explain(code: str) -> str:
     Explain code, detect bugs, analyze complexity
     """
     
-    print(f"[CODE TOOL] Analyzing {len(code)} characters of code")
+    logger.info("Analyzing %d characters of code", len(code))
     
     prompt = CODE_ANALYSIS_PROMPT.format(code=code)
-    explanation = inference(user_prompt=prompt)
+    explanation = inference(user_prompt=prompt, cache_as="code_explanation")
     
-    return explanation
\ No newline at end of file
+    return explanation
+
+
+async def aexplain(code: str) -> str:
+    logger.info("Analyzing %d characters of code", len(code))
+    
+    prompt = CODE_ANALYSIS_PROMPT.format(code=code)
+    return await ainference(user_prompt=prompt, stream_tokens=True, cache_as="code_explanation")
\ No newline at end of file
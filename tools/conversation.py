@@ -1,4 +1,4 @@
-from tools.llm_inference import inference
+from tools.llm_inference import inference, ainference
 
 CONVERSATION_PROMPT="""
 Hi, Following are the tasks that you can do:
@@ -18,4 +18,9 @@ Handle the user query humanly:
 
 def answer_question(prompt: str, json_mode: bool = False) -> str:
     user_prompt=CONVERSATION_PROMPT.format(user_query=prompt)
-    return inference(user_prompt=user_prompt)
\ No newline at end of file
+    return inference(user_prompt=user_prompt)
+
+
+async def aanswer_question(prompt: str, json_mode: bool = False) -> str:
+    user_prompt=CONVERSATION_PROMPT.format(user_query=prompt)
+    return await ainference(user_prompt=user_prompt, stream_tokens=True)
\ No newline at end of file
@@ -0,0 +1,93 @@
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from tools import file_source
+from tools.log import get_logger
+
+# On-disk cache of extraction results, keyed by a hash of the file bytes and
+# the extractor version. Entries are evicted least-recently-used first once
+# the directory grows past the size budget (0 disables the cache).
+CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", os.path.join(".cache", "extraction"))
+CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+_lock = threading.Lock()
+
+logger = get_logger("extraction_cache")
+
+
+def enabled() -> bool:
+    return CACHE_MAX_BYTES > 0
+
+
+def content_key(source: file_source.Source, input_type: str, extractor_version: str) -> str:
+    """Hash the file contents together with what will extract them"""
+    return f"{input_type}-v{extractor_version}-{file_source.sha256(source)}"
+
+
+def _entry_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+
+def get(key: str) -> Optional[Dict[str, Any]]:
+    path = _entry_path(key)
+    try:
+        with open(path, encoding="utf-8") as f:
+            entry = json.load(f)
+        # Touch the entry so eviction sees it as recently used
+        os.utime(path, None)
+        return entry
+    except (OSError, ValueError):
+        return None
+
+
+def put(key: str, result: Dict[str, Any]) -> bool:
+    """
+    Store a result and return whether it was written; like `get`, a cache
+    that can't be written is skipped
+    """
+    path = _entry_path(key)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Could not write extraction cache entry %s: %s", key, e)
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+    try:
+        _evict()
+    except OSError as e:
+        logger.warning("Extraction cache eviction failed: %s", e)
+    return True
+
+
+def _evict():
+    with _lock:
+        entries = []
+        total = 0
+        for name in os.listdir(CACHE_DIR):
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(CACHE_DIR, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, name in entries:
+            if total <= CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(os.path.join(CACHE_DIR, name))
+                total -= size
+            except OSError:
+                pass
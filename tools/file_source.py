@@ -0,0 +1,60 @@
+import hashlib
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import BinaryIO, Union
+
+# Extractors accept either a path on disk or a binary file-like object
+# (e.g. an in-memory / spooled upload).
+Source = Union[str, BinaryIO]
+
+
+def describe(source: Source) -> str:
+    return source if isinstance(source, str) else getattr(source, "name", "<upload>")
+
+
+def read_bytes(source: Source) -> bytes:
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return f.read()
+    source.seek(0)
+    data = source.read()
+    source.seek(0)
+    return data
+
+
+def sha256(source: Source) -> str:
+    digest = hashlib.sha256()
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    source.seek(0)
+    for chunk in iter(lambda: source.read(1024 * 1024), b""):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+@contextmanager
+def as_path(source: Source, suffix: str = ""):
+    """
+    Yield a filesystem path for tools that can only read from disk. File
+    objects are written to a temporary file that is always removed.
+    """
+    if isinstance(source, str):
+        yield source
+        return
+
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            source.seek(0)
+            for chunk in iter(lambda: source.read(1024 * 1024), b""):
+                f.write(chunk)
+        source.seek(0)
+        yield path
+    finally:
+        os.remove(path)
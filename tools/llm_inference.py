@@ -1,58 +1,422 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+import httpx
 from dotenv import load_dotenv, find_dotenv, get_key
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, OpenAIError
+from google import genai
+from google.genai import types
+
+from tools import metrics
+from tools.cache import TTLCache
+from tools.llm_router import Provider, ProviderConfigError, Router, StreamInterrupted
+from tools.log import get_logger
+
+logger = get_logger("llm")
+
+# Credentials and pool settings are read once at import time instead of
+# scanning the .env file on every call.
+_DOTENV_PATH = find_dotenv()
+load_dotenv(_DOTENV_PATH)
+
+NVIDIA_BASE_URL = os.getenv("NVIDIA_BASE_URL", "https://integrate.api.nvidia.com/v1")
+NVIDIA_API_KEY = (
+    (get_key(_DOTENV_PATH, "NVIDIA_API_KEY") if _DOTENV_PATH else None)
+    or os.getenv("NVIDIA_API_KEY")
+)
+DEFAULT_MODEL = "qwen/qwen3-next-80b-a3b-instruct"
+
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+
+# Gemini is reached through its OpenAI-compatible endpoint, so both
+# providers share one client and can be pointed at local stub servers
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta/openai/")
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY") or os.getenv("OPENAI_API_KEY")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+
+# Providers in order of preference (ones without an API key are skipped)
+LLM_PROVIDERS = [p.strip() for p in os.getenv("LLM_PROVIDERS", "nvidia,gemini").split(",") if p.strip()]
+# Overall deadline per call and timeout per attempt, in seconds
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "180"))
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "90"))
+# Retries after a failed attempt, with full-jitter exponential backoff
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+# A call slower than this percentile of the provider's recent latencies
+# is duplicated on the next provider; LLM_HEDGE_DELAY applies until
+# LLM_HEDGE_MIN_SAMPLES calls have been seen
+LLM_HEDGE = os.getenv("LLM_HEDGE", "1") == "1"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "10"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1"))
+# Consecutive failures that take a provider out of rotation, and for how long
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+# Sampling parameters of every routed call (part of the response cache key)
+SAMPLING = {"temperature": 0.2, "top_p": 0.7, "max_tokens": 8192}
+
+# Responses of the analysis tools (summary, sentiment, code explanation),
+# which are near-deterministic at this temperature. Set LLM_CACHE_PATH to
+# persist them in SQLite across restarts/workers; LLM_CACHE=0 disables.
+LLM_CACHE = os.getenv("LLM_CACHE", "1") == "1"
+response_cache = TTLCache(
+    "llm",
+    maxsize=int(os.getenv("LLM_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("LLM_CACHE_TTL", "86400")),
+    path=os.getenv("LLM_CACHE_PATH") or None
+)
+
+_PROVIDERS = {
+    "nvidia": Provider("nvidia", NVIDIA_BASE_URL, NVIDIA_API_KEY, DEFAULT_MODEL),
+    "gemini": Provider("gemini", GEMINI_BASE_URL, GEMINI_API_KEY, GEMINI_MODEL),
+}
+for _name in LLM_PROVIDERS:
+    if _name not in _PROVIDERS:
+        raise ValueError(f"Unknown LLM provider '{_name}', expected one of {list(_PROVIDERS)}")
+
+router = Router(
+    [_PROVIDERS[name] for name in LLM_PROVIDERS],
+    deadline=LLM_DEADLINE_SECONDS,
+    attempt_timeout=LLM_ATTEMPT_TIMEOUT,
+    retries=LLM_RETRIES,
+    backoff_base=LLM_BACKOFF_BASE,
+    backoff_max=LLM_BACKOFF_MAX,
+    hedge=LLM_HEDGE,
+    hedge_percentile=LLM_HEDGE_PERCENTILE,
+    hedge_min_samples=LLM_HEDGE_MIN_SAMPLES,
+    hedge_delay=LLM_HEDGE_DELAY,
+    hedge_min_delay=LLM_HEDGE_MIN_DELAY,
+    breaker_threshold=LLM_BREAKER_FAILURES,
+    breaker_cooldown=LLM_BREAKER_COOLDOWN,
+    max_workers=LLM_MAX_CONNECTIONS
+)
+
+_clients = {}
+_async_clients = {}
+_clients_lock = threading.Lock()
+
+# Callback receiving LLM output as it is generated. Set by the streaming
+# API for the duration of one request; None means no streaming.
+_token_sink = ContextVar("token_sink", default=None)
+
+# Set for a request that asked for fresh responses (no_cache)
+_cache_bypass = ContextVar("llm_cache_bypass", default=False)
 
-def inference(system_prompt="""""", user_prompt="""""", json_req=False):
-    client = OpenAI(
-        base_url = "https://integrate.api.nvidia.com/v1",
-        api_key = get_key(find_dotenv(), "NVIDIA_API_KEY")
+
+def set_token_sink(sink):
+    """Forward streamed tokens to `sink(text)` in the current context"""
+    return _token_sink.set(sink)
+
+
+def reset_token_sink(token):
+    _token_sink.reset(token)
+
+
+def bypass_cache():
+    """Skip cached responses in the current context (new ones are still stored)"""
+    return _cache_bypass.set(True)
+
+
+def _cache_key(template: str, model: str, system_prompt: str, user_prompt: str) -> str:
+    """Template name, model and sampling params, plus a hash of the prompt text"""
+    text = hashlib.sha256(f"{system_prompt}\0{user_prompt}".encode("utf-8")).hexdigest()
+    sampling = json.dumps(SAMPLING, sort_keys=True)
+    return f"{template}:{model}:{sampling}:{text}"
+
+
+def _cached(key: Optional[str]) -> Optional[str]:
+    if key is None or _cache_bypass.get():
+        return None
+    return response_cache.get(key)
+
+
+def _store(key: Optional[str], response: str):
+    if key is not None and response:
+        response_cache.set(key, response)
+
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
     )
 
-    completion = client.chat.completions.create(
-        model="qwen/qwen3-next-80b-a3b-instruct",
-        messages=[{"role":"user","content":user_prompt}],
-        temperature=0.2,
-        top_p=0.7,
-        max_tokens=8192,
-        stream=False
+
+def get_client(provider: str = "nvidia") -> OpenAI:
+    """
+    Return the process-wide client for `provider`, creating it on first
+    use. The underlying HTTP pool keeps connections alive between requests.
+    Retries are left to the router, which doesn't retry a client that
+    can't be created (e.g. no API key).
+    """
+    client = _clients.get(provider)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(provider)
+            if client is None:
+                try:
+                    client = OpenAI(
+                        base_url=_PROVIDERS[provider].base_url,
+                        api_key=_PROVIDERS[provider].api_key,
+                        max_retries=0,
+                        http_client=httpx.Client(limits=_http_limits()),
+                    )
+                except OpenAIError as e:
+                    raise ProviderConfigError(f"{provider}: {e}") from e
+                _clients[provider] = client
+    return client
+
+
+def get_async_client(provider: str = "nvidia") -> AsyncOpenAI:
+    """Async counterpart of get_client, used by the async workflow"""
+    client = _async_clients.get(provider)
+    if client is None:
+        with _clients_lock:
+            client = _async_clients.get(provider)
+            if client is None:
+                try:
+                    client = AsyncOpenAI(
+                        base_url=_PROVIDERS[provider].base_url,
+                        api_key=_PROVIDERS[provider].api_key,
+                        max_retries=0,
+                        http_client=httpx.AsyncClient(limits=_http_limits()),
+                    )
+                except OpenAIError as e:
+                    raise ProviderConfigError(f"{provider}: {e}") from e
+                _async_clients[provider] = client
+    return client
+
+
+def _model_for(provider: Provider, model: str) -> str:
+    """`model` names an NVIDIA-hosted model; other providers use their own"""
+    return model if provider.name == "nvidia" else provider.model
+
+
+def close_clients():
+    """Close all pooled sync clients"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+async def aclose_clients():
+    """Close all pooled clients (called on server shutdown)"""
+    close_clients()
+    with _clients_lock:
+        clients = list(_async_clients.values())
+        _async_clients.clear()
+    for client in clients:
+        await client.close()
+
+
+def _record_usage(model: str, start: float, usage):
+    """Report call latency and token usage (None when the server omits it)"""
+    metrics.record_llm(
+        model,
+        time.perf_counter() - start,
+        getattr(usage, "prompt_tokens", None),
+        getattr(usage, "completion_tokens", None)
     )
 
-    response = completion.choices[0].message.content.strip('\n')
 
-    if json_req == True:
-        import re
-        match = re.search(r'\{.*\}', response, re.DOTALL)
-        if not match:
-            raise ValueError("No JSON found in model output")
-        json_str = match.group()
-        print(json_str)
-        return json_str
+def _extract_json(text: str) -> str:
+    match = re.search(r'\{.*\}', text, re.DOTALL)
+    if not match:
+        raise ValueError("No JSON found in model output")
+    return match.group()
 
-    return response
 
-from google import genai
-from google.genai import types
-from dotenv import load_dotenv
-import os
+def _response_key(cache_as, model, system_prompt, user_prompt) -> Optional[str]:
+    if not cache_as or not LLM_CACHE:
+        return None
+    return _cache_key(cache_as, model, system_prompt, user_prompt)
+
+
+def _complete(choice) -> bool:
+    """False for a reply cut off at max_tokens"""
+    return getattr(choice, "finish_reason", None) != "length"
+
+
+def _finish(response: str, json_req: bool, key: Optional[str] = None, complete: bool = True) -> str:
+    """
+    Return the reply (its JSON part with `json_req`) and cache it under
+    `key`. Replies that fail validation or were cut off aren't cached, so
+    a bad answer isn't served again for the cache's lifetime.
+    """
+    result = response
+    if json_req:
+        result = _extract_json(response)
+        logger.debug("JSON output: %s", result)
+        try:
+            json.loads(result)
+        except ValueError:
+            logger.warning("Not caching a reply with malformed JSON")
+            return result
+    if complete:
+        _store(key, response)
+    return result
+
+
+def _lookup_key(cache_as, model, system_prompt, user_prompt) -> Optional[str]:
+    """Key of the answer the first routed provider would give"""
+    return _response_key(cache_as, _model_for(router.providers[0], model), system_prompt, user_prompt)
+
+
+def inference(system_prompt="""""", user_prompt="""""", json_req=False, model=DEFAULT_MODEL,
+              cache_as: Optional[str] = None):
+    """
+    Blocking inference. `cache_as` names the prompt template and enables
+    the response cache for this call.
+    """
+    response = _cached(_lookup_key(cache_as, model, system_prompt, user_prompt))
+    if response is not None:
+        return _finish(response, json_req)
+
+    def attempt(provider: Provider, timeout: float) -> str:
+        start = time.perf_counter()
+        name = _model_for(provider, model)
+        completion = get_client(provider.name).chat.completions.create(
+            model=name,
+            messages=[{"role":"user","content":user_prompt}],
+            stream=False,
+            timeout=timeout,
+            **SAMPLING
+        )
+        _record_usage(name, start, completion.usage)
+        choice = completion.choices[0]
+        return name, choice.message.content.strip('\n'), _complete(choice)
+
+    # Stored under the model that answered, which may be a fallback's
+    answered_by, response, complete = router.call(attempt, kind=cache_as)
+    key = _response_key(cache_as, answered_by, system_prompt, user_prompt)
+    return _finish(response, json_req, key, complete)
+
+
+async def ainference(system_prompt="""""", user_prompt="""""", json_req=False, model=DEFAULT_MODEL,
+                     stream_tokens=False, cache_as: Optional[str] = None):
+    """
+    Async inference. With `stream_tokens`, output is requested as a stream
+    and forwarded to the current token sink while it is generated (a
+    cached response is sent to the sink in one piece). `cache_as` names
+    the prompt template and enables the response cache for this call.
+    """
+    sink = _token_sink.get() if stream_tokens else None
+    response = _cached(_lookup_key(cache_as, model, system_prompt, user_prompt))
+    if response is not None:
+        if sink is not None:
+            sink(response)
+        return _finish(response, json_req)
+
+    if sink is not None:
+        answered_by, response, complete = await _astream_inference(user_prompt, model, sink)
+    else:
+        async def attempt(provider: Provider, timeout: float) -> str:
+            start = time.perf_counter()
+            name = _model_for(provider, model)
+            completion = await get_async_client(provider.name).chat.completions.create(
+                model=name,
+                messages=[{"role":"user","content":user_prompt}],
+                stream=False,
+                timeout=timeout,
+                **SAMPLING
+            )
+            _record_usage(name, start, completion.usage)
+            choice = completion.choices[0]
+            return name, choice.message.content.strip('\n'), _complete(choice)
+
+        answered_by, response, complete = await router.acall(attempt, kind=cache_as)
+
+    key = _response_key(cache_as, answered_by, system_prompt, user_prompt)
+    return _finish(response, json_req, key, complete)
+
+
+async def _astream_inference(user_prompt, model, sink):
+    """Stream through the router; returns (model that answered, text, complete)"""
+    async def attempt(provider: Provider, timeout: float) -> str:
+        start = time.perf_counter()
+        name = _model_for(provider, model)
+        parts = []
+        usage = None
+        complete = True
+        try:
+            stream = await get_async_client(provider.name).chat.completions.create(
+                model=name,
+                messages=[{"role":"user","content":user_prompt}],
+                stream=True,
+                timeout=timeout,
+                **SAMPLING,
+                # Usage arrives in a final chunk without choices
+                stream_options={"include_usage": True}
+            )
+            async for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                if chunk.choices[0].finish_reason:
+                    complete = _complete(chunk.choices[0])
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    sink(delta)
+        except Exception as e:
+            # Tokens already reached the client; another attempt would repeat them
+            if parts:
+                raise StreamInterrupted(f"{provider.name} stream failed: {e}") from e
+            raise
+
+        _record_usage(name, start, usage)
+        return name, "".join(parts).strip('\n'), complete
+
+    # Streams fail over before the first token but are never hedged
+    return await router.acall(attempt, stream=True)
+
+
+_gemini_client = None
+
+
+def _get_gemini_client() -> genai.Client:
+    # Created on first use: Gemini is optional and the SDK refuses a missing key
+    global _gemini_client
+    if _gemini_client is None:
+        _gemini_client = genai.Client(api_key=GEMINI_API_KEY)
+    return _gemini_client
 
-load_dotenv()
 
-client = genai.Client(api_key=os.getenv("OPENAI_API_KEY"))
 def inference_gemini(system_prompt="""""", user_prompt="""""", json_req=False):
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
+    """Direct call through the Gemini SDK, outside the router"""
+    start = time.perf_counter()
+    response = _get_gemini_client().models.generate_content(
+        model=GEMINI_MODEL,
         config=types.GenerateContentConfig(
             system_instruction=system_prompt),
         contents=user_prompt
     )
+    usage = response.usage_metadata
+    metrics.record_llm(
+        GEMINI_MODEL,
+        time.perf_counter() - start,
+        getattr(usage, "prompt_token_count", None),
+        getattr(usage, "candidates_token_count", None)
+    )
 
     if json_req == True:
-        import re
-        match = re.search(r'\{.*\}', response.text, re.DOTALL)
-        if not match:
-            raise ValueError("No JSON found in model output")
-        json_str = match.group()
-        print(json_str)
+        json_str = _extract_json(response.text)
+        logger.debug("JSON output: %s", json_str)
         return json_str
 
-    print(response.text)
-    return response.text
\ No newline at end of file
+    logger.debug("Gemini output: %s", response.text)
+    return response.text
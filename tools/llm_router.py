@@ -0,0 +1,394 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from tools import metrics
+from tools.log import get_logger
+
+# Routes an LLM call over several OpenAI-compatible providers:
+# - every call has an overall deadline, and each attempt a timeout
+# - failed rounds are retried with full-jitter backoff, starting at the
+#   next provider each time
+# - a call still running after the latency percentile of its provider and
+#   kind (prompt template) gets a hedged duplicate on the next provider; the
+#   first answer wins
+# - a provider that keeps failing is skipped until its cooldown passes
+
+logger = get_logger("llm_router")
+
+
+class Provider:
+    def __init__(self, name: str, base_url: str, api_key: Optional[str], model: str):
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures. Once `cooldown` seconds
+    have passed it is half-open: a single probe call is let through, and
+    its failure re-opens the breaker while a success closes it.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened = 0.0
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """Whether a call could be let through now (doesn't claim the probe)"""
+        with self._lock:
+            return self.failures < self.threshold or time.monotonic() - self.opened >= self.cooldown
+
+    def allow(self) -> bool:
+        """Let a call through, claiming the probe when half-open"""
+        with self._lock:
+            if self.failures < self.threshold:
+                return True
+            now = time.monotonic()
+            if now - self.opened < self.cooldown:
+                return False
+            # Claim the probe; restarting the cooldown keeps other calls out
+            # and frees the slot again if the probe never reports back
+            self.opened = now
+            self.probing = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.probing = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self.probing = False
+            if self.failures >= self.threshold:
+                self.opened = time.monotonic()
+
+    def state(self) -> str:
+        with self._lock:
+            if self.failures < self.threshold:
+                return "closed"
+            if self.probing or time.monotonic() - self.opened >= self.cooldown:
+                return "half-open"
+            return "open"
+
+
+class LatencyWindow:
+    """Recent successful call latencies of one provider"""
+
+    def __init__(self, size: int):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < max(min_samples, 1):
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class StreamInterrupted(RuntimeError):
+    """A stream failed after output was already forwarded; retrying would repeat it"""
+    retryable = False
+
+
+class DeadlineExceeded(TimeoutError):
+    """The call ran out of time; says nothing about the provider's health"""
+    retryable = False
+
+
+class CircuitOpen(RuntimeError):
+    """No provider could take the call (others hold the half-open probes)"""
+    retryable = True
+
+
+class ProviderConfigError(RuntimeError):
+    """A provider can't be called as configured (e.g. no API key)"""
+    retryable = False
+
+
+def provider_fault(e: BaseException) -> bool:
+    """
+    False for errors that are the request's fault (4xx other than
+    408/409/429), deadline exhaustion, configuration errors and calls
+    no breaker let through
+    """
+    if isinstance(e, (CircuitOpen, DeadlineExceeded, ProviderConfigError)):
+        return False
+    status = getattr(e, "status_code", None)
+    return status is None or status >= 500 or status in (408, 409, 429)
+
+
+def is_retryable(e: BaseException) -> bool:
+    return getattr(e, "retryable", provider_fault(e))
+
+
+class Router:
+    def __init__(self, providers: List[Provider], deadline: float, attempt_timeout: float,
+                 retries: int, backoff_base: float, backoff_max: float,
+                 hedge: bool, hedge_percentile: float, hedge_min_samples: int,
+                 hedge_delay: float, hedge_min_delay: float,
+                 breaker_threshold: int, breaker_cooldown: float,
+                 latency_window: int = 200, max_workers: int = 16):
+        # Providers without an API key are left out; the first one is kept
+        # regardless so a missing key still fails with the client's error
+        self.providers = [p for p in providers if p.api_key] or providers[:1]
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_delay = hedge_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.breakers = {p.name: CircuitBreaker(breaker_threshold, breaker_cooldown) for p in self.providers}
+        # Per (provider, call kind): short intent calls and long summaries
+        # would otherwise share one percentile and hedge most long calls
+        self.latency_window = latency_window
+        self.latency: Dict[tuple, LatencyWindow] = {}
+        self._latency_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+
+    def _order(self, round_no: int) -> List[Provider]:
+        """Providers that can take a call, rotated so each retry starts elsewhere"""
+        healthy = [p for p in self.providers if self.breakers[p.name].available()]
+        if not healthy:
+            # Everything is failing: trying beats refusing outright
+            healthy = list(self.providers)
+        shift = round_no % len(healthy)
+        return healthy[shift:] + healthy[:shift]
+
+    def _claim(self, order: List[Provider], skip: Optional[Provider] = None) -> Optional[Provider]:
+        """First provider in `order` whose breaker lets a call through right now"""
+        candidates = [p for p in order if p is not skip]
+        for provider in candidates:
+            if self.breakers[provider.name].allow():
+                return provider
+        if not any(self.breakers[p.name].available() for p in self.providers):
+            # Everything is failing (see _order)
+            return candidates[0] if candidates else None
+        return None
+
+    def _latency(self, provider: Provider, kind: Optional[str]) -> LatencyWindow:
+        key = (provider.name, kind)
+        with self._latency_lock:
+            if key not in self.latency:
+                self.latency[key] = LatencyWindow(self.latency_window)
+            return self.latency[key]
+
+    def _hedge_after(self, provider: Provider, kind: Optional[str] = None) -> float:
+        observed = self._latency(provider, kind).percentile(self.hedge_percentile, self.hedge_min_samples)
+        if observed is None:
+            return self.hedge_delay
+        return max(self.hedge_min_delay, observed)
+
+    def _backoff(self, round_no: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** round_no))
+
+    def _remaining(self, deadline: float) -> float:
+        return deadline - time.monotonic()
+
+    def _attempt_timeout(self, deadline: float, stream: bool) -> float:
+        # A stream's length depends on the output, so only the overall
+        # deadline bounds it (the client timeout still bounds each read)
+        remaining = self._remaining(deadline)
+        if remaining <= 0:
+            raise DeadlineExceeded("LLM call deadline exceeded")
+        return remaining if stream else min(self.attempt_timeout, remaining)
+
+    def _finished(self, provider: Provider, start: float, error: Optional[BaseException], stream: bool,
+                  kind: Optional[str] = None):
+        seconds = time.monotonic() - start
+        if error is None:
+            self.breakers[provider.name].success()
+            if not stream:
+                self._latency(provider, kind).add(seconds)
+            metrics.record_llm_attempt(provider.name, "ok", seconds)
+            return
+        if provider_fault(error):
+            self.breakers[provider.name].failure()
+        logger.warning("%s attempt failed after %.2fs: %r", provider.name, seconds, error)
+        metrics.record_llm_attempt(provider.name, "error", seconds)
+
+    def _failed(self, provider: Provider, start: float, error: Exception,
+                deadline: float, stream: bool) -> Exception:
+        """Record a failed attempt; one cut short by the call deadline isn't the provider's fault"""
+        if self._remaining(deadline) <= 0 and not isinstance(error, DeadlineExceeded):
+            error = DeadlineExceeded(f"LLM call deadline exceeded: {error!r}")
+        self._finished(provider, start, error, stream)
+        return error
+
+    def _hedges(self, order: List[Provider], stream: bool) -> bool:
+        return not stream and self.hedge and len(order) > 1
+
+    def _primary(self, order: List[Provider]) -> Provider:
+        primary = self._claim(order)
+        if primary is None:
+            raise CircuitOpen("No provider can take the call right now")
+        return primary
+
+    def _give_up(self, error: BaseException, round_no: int, deadline: float) -> float:
+        """Raise if the call can't be retried, else return the backoff delay"""
+        if not is_retryable(error) or round_no >= self.retries:
+            raise error
+        delay = self._backoff(round_no)
+        if self._remaining(deadline) <= delay:
+            raise error
+        return delay
+
+    # Async
+
+    async def _aattempt(self, attempt, provider: Provider, deadline: float, stream: bool, kind: Optional[str]):
+        timeout = self._attempt_timeout(deadline, stream)
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(attempt(provider, timeout), timeout)
+        except asyncio.CancelledError:
+            metrics.record_llm_attempt(provider.name, "cancelled", time.monotonic() - start)
+            raise
+        except Exception as e:
+            error = self._failed(provider, start, e, deadline, stream)
+            if error is e:
+                raise
+            raise error from e
+        self._finished(provider, start, None, stream, kind)
+        return result
+
+    async def _around(self, attempt, order: List[Provider], deadline: float, stream: bool, kind: Optional[str]):
+        primary = self._primary(order)
+        tasks = {asyncio.ensure_future(self._aattempt(attempt, primary, deadline, stream, kind)): primary}
+        errors = []
+        try:
+            if self._hedges(order, stream):
+                done, _ = await asyncio.wait(tasks, timeout=self._hedge_after(primary, kind))
+                hedge = None if done else self._claim(order, skip=primary)
+                if hedge is not None:
+                    logger.info("Hedging %s with %s", primary.name, hedge.name)
+                    metrics.record_hedge(hedge.name)
+                    tasks[asyncio.ensure_future(self._aattempt(attempt, hedge, deadline, stream, kind))] = hedge
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    del tasks[task]
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(task.exception())
+            raise errors[-1]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def acall(self, attempt: Callable[[Provider, float], Awaitable[Any]], stream: bool = False,
+                    kind: Optional[str] = None):
+        """
+        Run `attempt(provider, timeout)` under the routing policy and return
+        the first successful result. `kind` (e.g. the prompt template) picks
+        the latency history hedging compares against. Streams are never hedged.
+        """
+        deadline = time.monotonic() + self.deadline
+        round_no = 0
+        while True:
+            try:
+                return await self._around(attempt, self._order(round_no), deadline, stream, kind)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                delay = self._give_up(e, round_no, deadline)
+            await asyncio.sleep(delay)
+            round_no += 1
+
+    # Sync (threads; a losing attempt can't be interrupted and is left to finish)
+
+    def _attempt(self, attempt, provider: Provider, deadline: float, stream: bool, kind: Optional[str]):
+        timeout = self._attempt_timeout(deadline, stream)
+        start = time.monotonic()
+        try:
+            result = attempt(provider, timeout)
+        except Exception as e:
+            error = self._failed(provider, start, e, deadline, stream)
+            if error is e:
+                raise
+            raise error from e
+        self._finished(provider, start, None, stream, kind)
+        return result
+
+    def _submit(self, attempt, provider: Provider, deadline: float, stream: bool, kind: Optional[str]):
+        return self._pool.submit(copy_context().run, self._attempt, attempt, provider, deadline, stream, kind)
+
+    def _round(self, attempt, order: List[Provider], deadline: float, stream: bool, kind: Optional[str]):
+        primary = self._primary(order)
+        futures = {self._submit(attempt, primary, deadline, stream, kind): primary}
+        errors = []
+        if self._hedges(order, stream):
+            done, _ = wait(futures, timeout=self._hedge_after(primary, kind))
+            hedge = None if done else self._claim(order, skip=primary)
+            if hedge is not None:
+                logger.info("Hedging %s with %s", primary.name, hedge.name)
+                metrics.record_hedge(hedge.name)
+                futures[self._submit(attempt, hedge, deadline, stream, kind)] = hedge
+        while futures:
+            done, _ = wait(futures, timeout=max(0.0, self._remaining(deadline)), return_when=FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded("LLM call deadline exceeded")
+            for future in done:
+                del futures[future]
+                if future.exception() is None:
+                    for other in futures:
+                        other.cancel()
+                    return future.result()
+                errors.append(future.exception())
+        raise errors[-1]
+
+    def call(self, attempt: Callable[[Provider, float], Any], stream: bool = False,
+             kind: Optional[str] = None):
+        """Blocking counterpart of acall"""
+        deadline = time.monotonic() + self.deadline
+        round_no = 0
+        while True:
+            try:
+                return self._round(attempt, self._order(round_no), deadline, stream, kind)
+            except Exception as e:
+                delay = self._give_up(e, round_no, deadline)
+            time.sleep(delay)
+            round_no += 1
+
+    def status(self) -> Dict[str, Any]:
+        """Breaker state and hedge threshold (per call kind seen) of each provider"""
+        with self._latency_lock:
+            kinds = {}
+            for name, kind in self.latency:
+                kinds.setdefault(name, []).append(kind)
+        return {
+            p.name: {
+                "model": p.model,
+                "base_url": p.base_url,
+                "circuit": self.breakers[p.name].state(),
+                "hedge_after": {
+                    kind or "default": round(self._hedge_after(p, kind), 3)
+                    for kind in kinds.get(p.name, [None])
+                },
+            }
+            for p in self.providers
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
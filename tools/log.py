@@ -0,0 +1,90 @@
+import atexit
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict
+
+# Records are handed to a background thread through a queue, so request
+# handlers never block on stdout. Below WARNING, LOG_SAMPLE_RATE of the
+# records are kept and messages are cut to LOG_MAX_CHARS.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_MAX_CHARS = int(os.getenv("LOG_MAX_CHARS", "500"))
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+# Whether nodes add structured events to AgentState["logs"]
+STATE_LOGS = os.getenv("STATE_LOGS", "1") == "1"
+
+_listener = None
+_handler = None
+_setup_lock = threading.Lock()
+
+
+class _SampleFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or LOG_SAMPLE_RATE >= 1:
+            return True
+        return random.random() < LOG_SAMPLE_RATE
+
+
+class _TruncatingQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        # Errors keep their full traceback
+        if record.levelno < logging.ERROR and len(record.msg) > LOG_MAX_CHARS:
+            record.msg = f"{record.msg[:LOG_MAX_CHARS]}... [{len(record.msg)} chars]"
+            record.message = record.msg
+        return record
+
+
+def _setup():
+    global _listener, _handler
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        records = queue.SimpleQueue()
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(logging.Formatter(LOG_FORMAT))
+
+        _handler = _TruncatingQueueHandler(records)
+        _handler.addFilter(_SampleFilter())
+
+        root = logging.getLogger("dsai")
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(_handler)
+        root.propagate = False
+
+        _listener = QueueListener(records, output)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener, _handler
+    with _setup_lock:
+        if _listener is not None:
+            logging.getLogger("dsai").removeHandler(_handler)
+            _listener.stop()
+            _listener = _handler = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    _setup()
+    return logging.getLogger(f"dsai.{name}")
+
+
+def log_event(state, node: str, message: str, **fields: Any):
+    """
+    Append a structured event to the "logs" of a state or of a node's
+    partial update (if STATE_LOGS is on)
+    """
+    if not STATE_LOGS:
+        return
+    event: Dict[str, Any] = {"node": node, "message": message}
+    event.update(fields)
+    state["logs"].append(event)
@@ -0,0 +1,224 @@
+import threading
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+# Process-wide counters and histograms rendered in the Prometheus text
+# format at /metrics, plus an optional per-request trace of the same
+# events (attached to API responses when debug is set).
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536)
+
+_trace = ContextVar("metrics_trace", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self) -> Dict[tuple, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_label_text(key)} {_format(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets) + (float("inf"),)
+        # labels -> [bucket counts..., sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                labels = _label_text(key + (("le", _format(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(key)} {_format(values[-2])}")
+            lines.append(f"{self.name}_count{_label_text(key)} {values[-1]}")
+        return lines
+
+
+node_seconds = Histogram("agent_node_seconds", "Wall time of each graph node")
+llm_seconds = Histogram("llm_request_seconds", "Wall time of LLM calls")
+llm_tokens = Counter("llm_tokens_total", "LLM tokens by model and kind (prompt/completion)")
+llm_completion_tokens = Histogram(
+    "llm_completion_tokens", "Completion tokens per LLM call", TOKEN_BUCKETS
+)
+extraction_seconds = Histogram("extraction_seconds", "Wall time of content extraction")
+extracted_bytes = Histogram("extracted_bytes", "Bytes of text extracted per input", BYTES_BUCKETS)
+ocr_page_seconds = Histogram("ocr_page_seconds", "OCR time per image or PDF page")
+ocr_pages = Counter("ocr_pages_total", "Images and PDF pages run through OCR")
+cache_lookups = Counter("cache_lookups_total", "Cache lookups by cache and result (hit/miss)")
+llm_attempts = Counter("llm_attempts_total", "LLM attempts by provider and outcome (ok/error/cancelled)")
+llm_hedges = Counter("llm_hedges_total", "Hedged second requests, by the provider they went to")
+
+METRICS = [
+    node_seconds, llm_seconds, llm_tokens, llm_completion_tokens,
+    extraction_seconds, extracted_bytes, ocr_page_seconds, ocr_pages, cache_lookups,
+    llm_attempts, llm_hedges
+]
+
+
+def start_trace() -> List[Dict[str, Any]]:
+    """
+    Collect events in the current context (one request, which runs in its
+    own task) into the returned list
+    """
+    events = []
+    _trace.set(events)
+    return events
+
+
+def _record(event: str, **fields):
+    events = _trace.get()
+    if events is not None:
+        events.append({"event": event, **fields})
+
+
+def record_node(node: str, seconds: float):
+    node_seconds.observe(seconds, node=node)
+    _record("node", node=node, seconds=round(seconds, 4))
+
+
+def record_llm(model: str, seconds: float, prompt_tokens: Optional[int] = None,
+               completion_tokens: Optional[int] = None):
+    llm_seconds.observe(seconds, model=model)
+    if prompt_tokens is not None:
+        llm_tokens.inc(prompt_tokens, model=model, kind="prompt")
+    if completion_tokens is not None:
+        llm_tokens.inc(completion_tokens, model=model, kind="completion")
+        llm_completion_tokens.observe(completion_tokens, model=model)
+    _record("llm", model=model, seconds=round(seconds, 4),
+            prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+def record_llm_attempt(provider: str, outcome: str, seconds: float):
+    llm_attempts.inc(provider=provider, outcome=outcome)
+    _record("llm_attempt", provider=provider, outcome=outcome, seconds=round(seconds, 4))
+
+
+def record_hedge(provider: str):
+    llm_hedges.inc(provider=provider)
+    _record("llm_hedge", provider=provider)
+
+
+def record_extraction(input_type: str, seconds: float, nbytes: int):
+    extraction_seconds.observe(seconds, input_type=input_type)
+    extracted_bytes.observe(nbytes, input_type=input_type)
+    _record("extraction", input_type=input_type, seconds=round(seconds, 4), bytes=nbytes)
+
+
+def record_ocr_page(seconds: float, source: str):
+    ocr_page_seconds.observe(seconds, source=source)
+    ocr_pages.inc(source=source)
+    _record("ocr_page", source=source, seconds=round(seconds, 4))
+
+
+def record_cache(cache: str, hit: bool):
+    cache_lookups.inc(cache=cache, result="hit" if hit else "miss")
+    _record("cache", cache=cache, hit=hit)
+
+
+def summarize(events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Per-request totals for the debug payload"""
+    llm = [e for e in events if e["event"] == "llm"]
+    nodes = {}
+    caches = {}
+    for e in events:
+        if e["event"] == "node":
+            # The execute node runs once per wave of ready plan steps
+            nodes[e["node"]] = round(nodes.get(e["node"], 0) + e["seconds"], 4)
+        elif e["event"] == "cache":
+            stats = caches.setdefault(e["cache"], {"hits": 0, "misses": 0})
+            stats["hits" if e["hit"] else "misses"] += 1
+    return {
+        "nodes": nodes,
+        "llm_calls": len(llm),
+        "llm_seconds": round(sum(e["seconds"] for e in llm), 4),
+        "prompt_tokens": sum(e["prompt_tokens"] or 0 for e in llm),
+        "completion_tokens": sum(e["completion_tokens"] or 0 for e in llm),
+        "hedged_requests": sum(1 for e in events if e["event"] == "llm_hedge"),
+        "extracted_bytes": sum(e["bytes"] for e in events if e["event"] == "extraction"),
+        "ocr_pages": sum(1 for e in events if e["event"] == "ocr_page"),
+        "caches": caches,
+        "events": events
+    }
+
+
+def _cache_lines() -> List[str]:
+    lines = [
+        "# HELP cache_hit_ratio Share of cache lookups that were hits",
+        "# TYPE cache_hit_ratio gauge"
+    ]
+    totals = {}
+    for key, value in cache_lookups.values().items():
+        labels = dict(key)
+        counts = totals.setdefault(labels["cache"], {"hit": 0, "miss": 0})
+        counts[labels["result"]] += value
+    for cache, counts in sorted(totals.items()):
+        lookups = counts["hit"] + counts["miss"]
+        ratio = counts["hit"] / lookups if lookups else 0.0
+        lines.append(f"cache_hit_ratio{_label_text((('cache', cache),))} {_format(ratio)}")
+
+    from tools.cache import all_stats
+    lines += ["# HELP cache_entries Entries held by each in-process cache", "# TYPE cache_entries gauge"]
+    for name, stats in sorted(all_stats().items()):
+        lines.append(f"cache_entries{_label_text((('cache', name),))} {stats['size']}")
+    return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    lines += _cache_lines()
+    return "\n".join(lines) + "\n"
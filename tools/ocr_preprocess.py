@@ -0,0 +1,126 @@
+import os
+import statistics
+from typing import List, Optional
+from PIL import Image, ImageOps
+
+# Grayscale -> downscale -> Otsu binarization -> deskew before OCR.
+# Everything uses Pillow only, so no extra image dependencies are needed.
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "1") == "1"
+# Images larger than this on their longest side (e.g. phone screenshots)
+# are scaled down; Tesseract gains nothing from oversized glyphs
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "2500"))
+
+DESKEW_MAX_ANGLE = 5.0
+DESKEW_STEP = 0.5
+# Skew is estimated on a thumbnail this size
+PROBE_SIDE = 800
+# A row counts as text when at least this share of its pixels is ink
+INK_ROW_RATIO = 0.02
+
+
+def otsu_threshold(gray: Image.Image) -> int:
+    """Threshold that best separates ink from background (Otsu's method)"""
+    histogram = gray.histogram()[:256]
+    total = sum(histogram)
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+
+    best_threshold, best_variance = 127, 0.0
+    weight_bg, sum_bg = 0, 0
+    for i, count in enumerate(histogram):
+        weight_bg += count
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += i * count
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = i, variance
+    return best_threshold
+
+
+def binarize(gray: Image.Image, threshold: Optional[int] = None) -> Image.Image:
+    """Black and white, kept in "L" mode"""
+    if threshold is None:
+        threshold = otsu_threshold(gray)
+    return gray.point(lambda p: 255 if p > threshold else 0)
+
+
+def _to_gray(img: Image.Image) -> Image.Image:
+    # Transparent areas would otherwise turn black
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        background = Image.new("RGBA", img.size, "white")
+        img = Image.alpha_composite(background, img.convert("RGBA"))
+    return img.convert("L")
+
+
+def ink_ratio(binary: Image.Image) -> float:
+    histogram = binary.histogram()
+    return histogram[0] / max(sum(histogram), 1)
+
+
+def _row_ink(binary: Image.Image) -> List[float]:
+    """Share of ink per pixel row (a width-1 box resize averages each row)"""
+    return [1 - v / 255 for v in binary.resize((1, binary.height), Image.BOX).getdata()]
+
+
+def _thumbnail(img: Image.Image) -> Image.Image:
+    scale = PROBE_SIDE / max(img.size)
+    if scale >= 1:
+        return img
+    return img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))), Image.BOX)
+
+
+def estimate_skew(binary: Image.Image) -> float:
+    """
+    Angle (degrees, counter-clockwise) that straightens the text lines,
+    found by maximising the sharpness of the row ink profile
+    """
+    probe = _thumbnail(binary)
+    best_angle, best_score = 0.0, -1.0
+    steps = int(DESKEW_MAX_ANGLE / DESKEW_STEP)
+    for k in range(-steps, steps + 1):
+        angle = k * DESKEW_STEP
+        rows = _row_ink(probe.rotate(angle, fillcolor=255))
+        score = sum((a - b) ** 2 for a, b in zip(rows, rows[1:]))
+        if score > best_score:
+            best_angle, best_score = angle, score
+    return best_angle
+
+
+def line_height(binary: Image.Image) -> Optional[float]:
+    """Median height in pixels of the text lines, or None if there are none"""
+    runs = []
+    run = 0
+    for ink in _row_ink(binary) + [0.0]:
+        if ink >= INK_ROW_RATIO:
+            run += 1
+        elif run:
+            runs.append(run)
+            run = 0
+    return statistics.median(runs) if runs else None
+
+
+def preprocess(img: Image.Image, max_side: Optional[int] = OCR_MAX_SIDE) -> Image.Image:
+    """Return a cleaned-up, binarized copy of `img` ready for OCR"""
+    gray = _to_gray(img)
+
+    if max_side and max(gray.size) > max_side:
+        scale = max_side / max(gray.size)
+        gray = gray.resize((int(gray.width * scale), int(gray.height * scale)), Image.LANCZOS)
+
+    threshold = otsu_threshold(gray)
+    # Mostly-dark images (dark mode screenshots, code editors) have light
+    # text; flip them so Tesseract always sees dark text on white
+    if ink_ratio(binarize(gray, threshold)) > 0.5:
+        gray = ImageOps.invert(gray)
+        threshold = 255 - threshold - 1
+
+    angle = estimate_skew(binarize(gray, threshold))
+    if angle:
+        gray = gray.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+
+    return binarize(gray, threshold)
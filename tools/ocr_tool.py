@@ -1,31 +1,156 @@
+import glob
+import os
+import threading
+import time
 import pytesseract
 from PIL import Image
+from tools.file_source import Source, describe
+from tools import metrics, ocr_preprocess
+from tools.log import get_logger
 
-pytesseract.pytesseract.tesseract_cmd = (
-    r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# "tesserocr" keeps an initialised Tesseract engine per thread / worker
+# process and passes images in memory. "pytesseract" runs the tesseract
+# binary once per image. "auto" uses tesserocr when it is installed.
+OCR_ENGINE = os.getenv("OCR_ENGINE", "auto")
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+
+pytesseract.pytesseract.tesseract_cmd = os.getenv(
+    "TESSERACT_CMD",
+    r"C:\Program Files\Tesseract-OCR\tesseract.exe" if os.name == "nt" else "tesseract"
 )
 
-def extract(image_path: str) -> dict:
+# Where tesserocr looks for language data when TESSDATA_PREFIX isn't set;
+# the PyPI wheels bundle the library but not the data, and don't know where
+# the system tesseract keeps it
+TESSDATA_DIRS = [
+    "/usr/share/tesseract-ocr/*/tessdata",
+    "/usr/share/tessdata",
+    "/usr/local/share/tessdata",
+    "/opt/homebrew/share/tessdata",
+    r"C:\Program Files\Tesseract-OCR\tessdata",
+]
+
+_engines = threading.local()
+logger = get_logger("ocr")
+
+
+def _resolve_engine() -> str:
+    if OCR_ENGINE not in ("auto", "tesserocr", "pytesseract"):
+        raise ValueError(f"Unknown OCR_ENGINE: {OCR_ENGINE}")
+    if OCR_ENGINE == "pytesseract":
+        return "pytesseract"
+    if tesserocr is None:
+        if OCR_ENGINE == "tesserocr":
+            logger.warning("tesserocr is not installed, falling back to pytesseract")
+        return "pytesseract"
+    return "tesserocr"
+
+
+ENGINE = _resolve_engine()
+
+
+def _tessdata_path() -> str:
+    if os.getenv("TESSDATA_PREFIX"):
+        return os.environ["TESSDATA_PREFIX"]
+    lang = OCR_LANG.split("+")[0]
+    for pattern in TESSDATA_DIRS:
+        for path in sorted(glob.glob(pattern), reverse=True):
+            if os.path.isfile(os.path.join(path, f"{lang}.traineddata")):
+                return path
+    return tesserocr.get_languages()[0]
+
+
+def get_engine():
+    """
+    Return this thread's Tesseract engine, creating it on first use so the
+    language data is only loaded once per thread. None means pytesseract.
+    """
+    global ENGINE
+    if ENGINE != "tesserocr":
+        return None
+
+    api = getattr(_engines, "api", None)
+    if api is None:
+        try:
+            api = tesserocr.PyTessBaseAPI(path=_tessdata_path(), lang=OCR_LANG)
+        except RuntimeError as e:
+            # Typically the language data isn't where the library looks for
+            # it (set TESSDATA_PREFIX); the tesseract binary may still work
+            logger.warning("Could not start tesserocr (%s), falling back to pytesseract", e)
+            ENGINE = "pytesseract"
+            return None
+        _engines.api = api
+    return api
+
+
+def warm_up():
+    """Initialise the engine ahead of time (used as an OCR pool initializer)"""
+    get_engine()
+
+
+def extract(image: Source) -> dict:
     """
-    Extract text from image using OCR
+    Extract text from an image path or file object using OCR
     """
-    
-    print(f"[OCR TOOL] Processing: {image_path}")
-    
-    img = Image.open(image_path)
+
+    logger.info("Processing: %s", describe(image))
+
+    start = time.perf_counter()
+    with Image.open(image) as img:
+        result = extract_image(img)
+    metrics.record_ocr_page(time.perf_counter() - start, "image")
+    return result
+
+
+def _tesserocr_words(api, img: Image.Image) -> list:
+    level = tesserocr.RIL.WORD
+    api.SetImage(img)
+    try:
+        api.Recognize()
+        iterator = api.GetIterator()
+        if iterator is None:
+            return []
+        return [
+            (word.GetUTF8Text(level), word.Confidence(level))
+            for word in tesserocr.iterate_level(iterator, level)
+        ]
+    finally:
+        api.Clear()
+
+
+def _pytesseract_words(img: Image.Image) -> list:
     data = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
-    
+    return list(zip(data['text'], data['conf']))
+
+
+def extract_image(img: Image.Image, preprocess: bool = True) -> dict:
+    """
+    Extract text from an already loaded image, without touching disk.
+    Pass preprocess=False for images that were already cleaned up.
+    """
+
+    if preprocess and ocr_preprocess.OCR_PREPROCESS:
+        img = ocr_preprocess.preprocess(img)
+
+    api = get_engine()
+    words = _tesserocr_words(api, img) if api is not None else _pytesseract_words(img)
+
     text_parts = []
     confidences = []
-    
-    for i, conf in enumerate(data['conf']):
+
+    for word, conf in words:
         if int(conf) > 0:
-            text_parts.append(data['text'][i])
+            text_parts.append(word)
             confidences.append(int(conf))
-    
+
     text = ' '.join(text_parts)
     avg_confidence = sum(confidences) / len(confidences) if confidences else 0
-    
+
     return {
         "text": text,
         "confidence": avg_confidence / 100,
@@ -34,4 +159,4 @@ def extract(image_path: str) -> dict:
 
 
 if __name__ == "__main__":
-    print(extract("code_screenshot.png"))
\ No newline at end of file
+    print(extract("code_screenshot.png"))
@@ -0,0 +1,43 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, copy_context
+
+# Bounded pool for blocking extraction work (OCR, PDF parsing, ASR) so the
+# event loop stays free to serve other chats. Background jobs get their own
+# pool so long extractions can't starve interactive requests.
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "4"))
+JOB_EXTRACTION_WORKERS = int(os.getenv("JOB_EXTRACTION_WORKERS", "2"))
+
+_executor = ThreadPoolExecutor(
+    max_workers=EXTRACTION_WORKERS,
+    thread_name_prefix="extract"
+)
+_background_executor = ThreadPoolExecutor(
+    max_workers=JOB_EXTRACTION_WORKERS,
+    thread_name_prefix="extract-job"
+)
+
+_use_background = ContextVar("use_background_pool", default=False)
+
+
+def use_background_pool():
+    """Send blocking work from the current context to the background pool"""
+    return _use_background.set(True)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking function on the extraction pool and await its result.
+    Context variables (e.g. the request's metrics trace) carry over.
+    """
+    loop = asyncio.get_running_loop()
+    executor = _background_executor if _use_background.get() else _executor
+    ctx = copy_context()
+    return await loop.run_in_executor(executor, functools.partial(ctx.run, func, *args, **kwargs))
+
+
+def shutdown_executor():
+    _executor.shutdown(wait=False, cancel_futures=True)
+    _background_executor.shutdown(wait=False, cancel_futures=True)
@@ -1,72 +1,214 @@
-from typing import Dict, Optional
+from typing import Dict, List, Optional
+import multiprocessing
 import os
-import pdfplumber
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 import fitz
-from pdf2image import convert_from_path
-import tempfile
-from tools.ocr_tool import extract
+from PIL import Image, ImageOps
+from tools.ocr_tool import extract_image, warm_up
+from tools.ocr_preprocess import OCR_PREPROCESS, binarize, ink_ratio, line_height, preprocess
+from tools.file_source import Source, read_bytes
+from tools import metrics
+
+# Scanned pages are rendered at a DPI picked per page: a low-DPI probe
+# measures the text line height, and the page is rendered so lines come
+# out around TARGET_LINE_PX tall, within [OCR_MIN_DPI, OCR_DPI]
+OCR_DPI = int(os.getenv("OCR_DPI", "300"))
+OCR_MIN_DPI = int(os.getenv("OCR_MIN_DPI", "150"))
+OCR_PROBE_DPI = 72
+TARGET_LINE_PX = 40
+# Pages with less ink than this in the probe are treated as blank
+BLANK_INK_RATIO = 0.001
+BLANK_PAGE = {"text": "", "confidence": 0}
+# Worker processes used to OCR scanned pages in parallel (1 = sequential)
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+# Pages without at least this many characters of text layer are OCR'd
+MIN_TEXT_CHARS = 1
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+
+def _pixmap_image(page, dpi: int) -> Image.Image:
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    return Image.frombytes("L", (pix.width, pix.height), pix.samples)
+
+
+def choose_dpi(page) -> Optional[int]:
+    """Render DPI for a scanned page, or None if the page is blank"""
+    probe = binarize(_pixmap_image(page, OCR_PROBE_DPI))
+    ink = ink_ratio(probe)
+    if ink < BLANK_INK_RATIO:
+        return None
+    if ink > 0.5:
+        # Light text on a dark page
+        probe = ImageOps.invert(probe)
+
+    height = line_height(probe)
+    if not height:
+        return OCR_DPI
+    dpi = OCR_PROBE_DPI * TARGET_LINE_PX / height
+    return int(min(max(dpi, OCR_MIN_DPI), OCR_DPI))
+
+
+def _render_page(page) -> Optional[tuple]:
+    """
+    Rasterise a page to raw grayscale pixels that can be sent to a worker,
+    or None for a blank page
+    """
+    dpi = choose_dpi(page)
+    if dpi is None:
+        return None
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    return pix.width, pix.height, pix.samples
+
+
+def _ocr_pixels(job) -> dict:
+    """
+    OCR one rendered page (runs inside an OCR worker process). The OCR
+    time is returned with the result so the parent can record it.
+    """
+    start = time.perf_counter()
+    width, height, samples = job
+    with Image.frombytes("L", (width, height), samples) as img:
+        if OCR_PREPROCESS:
+            # The DPI already sets the scale, so only clean up and deskew
+            img = preprocess(img, max_side=None)
+        result = extract_image(img, preprocess=False)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def _new_pool(workers: int) -> ProcessPoolExecutor:
+    # Workers come from a forkserver (spawn where there is none): forking the
+    # server, which runs several threads, could copy a lock one of them holds
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=warm_up)
+
+
+def _get_ocr_pool() -> ProcessPoolExecutor:
+    """Long-lived OCR workers, each keeping its own initialised engine"""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            _ocr_pool = _new_pool(OCR_WORKERS)
+        return _ocr_pool
+
+
+def shutdown_ocr_pool():
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is not None:
+            _ocr_pool.shutdown(wait=False, cancel_futures=True)
+            _ocr_pool = None
+
+
+def _ocr_pages(doc, page_indexes: List[int], workers: int) -> Dict[int, dict]:
+    """
+    OCR the given pages of an open document. Pages are rendered lazily and
+    at most 2 * workers rendered pages are in flight, so peak memory stays
+    flat regardless of page count.
+    """
+    results = {}
+    if workers <= 1 or len(page_indexes) <= 1:
+        for i in page_indexes:
+            job = _render_page(doc[i])
+            results[i] = _ocr_pixels(job) if job is not None else BLANK_PAGE
+        return results
+
+    pending = {}
+    max_in_flight = workers * 2
+
+    def collect(futures):
+        for future in futures:
+            results[pending.pop(future)] = future.result()
+
+    temp_pool = None
+    if workers == OCR_WORKERS:
+        pool = _get_ocr_pool()
+    else:
+        pool = temp_pool = _new_pool(min(workers, len(page_indexes)))
 
-def is_scanned_pdf(pdf_path: str, max_pages: int = 2) -> bool:
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages[:max_pages]:
-                text = page.extract_text()
-                if text and text.strip():
-                    return False
-        return True
-    except Exception:
-        return True
-
-
-def extract_digital_pdf(pdf_path: str) -> str:
-    pdf_len = 0
-    text_chunks = []
-    with fitz.open(pdf_path) as doc:
-        pdf_len = len(doc)
-        for page in doc:
-            page_text = page.get_text("text")
-            if page_text:
-                text_chunks.append(page_text)
-    return "\n".join(text_chunks), pdf_len
-
-
-def extract_pdf(pdf_path: str) -> Dict[str, Optional[str]]:
-    if not os.path.exists(pdf_path):
-        raise FileNotFoundError(f"PDF not found: {pdf_path}")
-
-    # Detect PDF type
-    scanned = is_scanned_pdf(pdf_path)
-    print(scanned)
-
-    # Digital PDF
-    if not scanned:
-        text, pdf_len = extract_digital_pdf(pdf_path)
-        return {
-            "text": text.strip() if text else None,
-            "confidence": 1.0 if text else 0.0,
-            "pages": pdf_len
-        }
-
-    # Scanned PDF → OCR
-    images = convert_from_path(pdf_path, dpi=300)
-
-    text_parts = []
-    confidences = []
-
-    with tempfile.TemporaryDirectory() as tmpdir:
-        for i, img in enumerate(images):
-            img_path = os.path.join(tmpdir, f"page_{i}.png")
-            img.save(img_path)
-
-            ocr_result = extract(img_path)
-            if ocr_result.get("text"):
-                text_parts.append(ocr_result["text"])
-                confidences.append(ocr_result.get("confidence", 0))
+        for i in page_indexes:
+            job = _render_page(doc[i])
+            if job is None:
+                results[i] = BLANK_PAGE
+                continue
+            if len(pending) >= max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[pool.submit(_ocr_pixels, job)] = i
+        collect(list(pending))
+    except BaseException:
+        # Don't leave this document's queued pages to the shared pool
+        for future in pending:
+            future.cancel()
+        raise
+    finally:
+        if temp_pool is not None:
+            temp_pool.shutdown()
+
+    return results
+
 
+def _open(source: Source):
+    if isinstance(source, str):
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"PDF not found: {source}")
+        return fitz.open(source)
+    return fitz.open(stream=read_bytes(source), filetype="pdf")
+
+
+def extract_pdf(source: Source, workers: Optional[int] = None) -> Dict[str, Optional[str]]:
+    """
+    Extract text from a PDF path or file object, opening it once with
+    PyMuPDF. Pages with a text layer are read directly; pages without one
+    are OCR'd (in parallel when OCR_WORKERS > 1). Mixed documents keep
+    page order.
+    """
+    workers = OCR_WORKERS if workers is None else workers
+
+    with _open(source) as doc:
+        page_count = len(doc)
+        page_texts = [None] * page_count
+        page_confidences = [None] * page_count
+
+        scanned_pages = []
+        for i, page in enumerate(doc):
+            text = page.get_text("text")
+            if len(text.strip()) >= MIN_TEXT_CHARS:
+                page_texts[i] = text
+                page_confidences[i] = 1.0
+            else:
+                scanned_pages.append(i)
+
+        for i, ocr_result in _ocr_pages(doc, scanned_pages, workers).items():
+            if "seconds" in ocr_result:
+                metrics.record_ocr_page(ocr_result["seconds"], "pdf")
+            page_texts[i] = ocr_result.get("text") or None
+            page_confidences[i] = ocr_result.get("confidence", 0)
+
+    text_parts = [t for t in page_texts if t]
+    # Average over pages that produced text
+    confidences = [c for t, c in zip(page_texts, page_confidences) if t]
     avg_conf = sum(confidences) / len(confidences) if confidences else 0.0
 
+    if not scanned_pages:
+        origin = "text"
+    elif len(scanned_pages) == page_count:
+        origin = "OCR"
+    else:
+        origin = "mixed"
+
+    text = "\n".join(text_parts).strip()
     return {
-        "text": "\n".join(text_parts) if text_parts else None,
+        "text": text or None,
         "confidence": avg_conf,
-        "source": "OCR"
+        "page_confidences": page_confidences,
+        "pages": page_count,
+        "ocr_pages": len(scanned_pages),
+        "source": origin
     }
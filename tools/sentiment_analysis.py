@@ -1,4 +1,4 @@
-from tools.llm_inference import inference
+from tools.llm_inference import inference, ainference
 
 SENTIMENT_PROMPT = """
 Analyze the sentiment of this text.
@@ -15,6 +15,11 @@ Return ONLY valid JSON with this exact structure:
 
 def analyze(user_text:str):
     prompt = SENTIMENT_PROMPT.format(text=user_text)
-    analysis = inference(user_prompt=prompt, json_req=True)
+    analysis = inference(user_prompt=prompt, json_req=True, cache_as="sentiment")
     
-    return analysis
\ No newline at end of file
+    return analysis
+
+
+async def aanalyze(user_text:str):
+    prompt = SENTIMENT_PROMPT.format(text=user_text)
+    return await ainference(user_prompt=prompt, json_req=True, cache_as="sentiment")
\ No newline at end of file
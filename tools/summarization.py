@@ -1,4 +1,11 @@
-from tools.llm_inference import inference
+import asyncio
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from tools.llm_inference import inference, ainference
+from tools.log import get_logger
 
 SUMMARIZATION_PROMPT = """
 Summarize the following text in exactly 3 formats:
@@ -24,6 +31,140 @@ DETAILED SUMMARY:
 [sentence 1] [sentence 2] [sentence 3] [sentence 4] [sentence 5]
 """
 
+CHUNK_SUMMARY_PROMPT = """
+The text below is one section of a longer document.
+Summarize it in one short paragraph, keeping every key fact, name and number.
+Return only the summary.
+
+Section:
+{text}
+"""
+
+# Long inputs are split into chunks of roughly this many tokens, summarized
+# concurrently (map), then combined into the final format (reduce). Partial
+# summaries are reduced again until they fit in one chunk, for at most
+# SUMMARY_MAX_REDUCE_ROUNDS rounds.
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "6000"))
+SUMMARY_MAX_PARALLEL = int(os.getenv("SUMMARY_MAX_PARALLEL", "4"))
+SUMMARY_MAX_REDUCE_ROUNDS = int(os.getenv("SUMMARY_MAX_REDUCE_ROUNDS", "8"))
+CHARS_PER_TOKEN = 4
+
+logger = get_logger("summarization")
+
+
+def _split_oversized(piece: str, max_chars: int) -> List[str]:
+    """Split a piece that alone exceeds the budget, preferring sentence ends"""
+    sentences = re.split(r'(?<=[.!?])\s+', piece)
+    parts = []
+    for sentence in sentences:
+        while len(sentence) > max_chars:
+            parts.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        parts.append(sentence)
+    return parts
+
+
+def chunk_text(text: str, max_tokens: int = SUMMARY_CHUNK_TOKENS) -> List[str]:
+    """
+    Split text into chunks of at most `max_tokens` (estimated), breaking on
+    paragraph, then line, then sentence boundaries.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return [text]
+
+    pieces = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for line in paragraph.split("\n"):
+            if len(line) <= max_chars:
+                pieces.append(line)
+            else:
+                pieces.extend(_split_oversized(line, max_chars))
+
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if not piece.strip():
+            continue
+        if current and len(current) + len(piece) + 2 > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+
+    return chunks
+
+
+def _reduce_input(chunks: List[str]) -> str:
+    """Text for the final prompt, capped if reduction didn't converge"""
+    if len(chunks) == 1:
+        return chunks[0]
+    text = "\n\n".join(chunks)
+    max_chars = SUMMARY_CHUNK_TOKENS * CHARS_PER_TOKEN
+    logger.warning(
+        "Summaries still span %d chunks after %d reduce rounds; dropping the last %d of %d chars",
+        len(chunks), SUMMARY_MAX_REDUCE_ROUNDS, max(0, len(text) - max_chars), len(text)
+    )
+    return text[:max_chars]
+
+
+def _summarize_chunk(chunk: str) -> str:
+    return inference(user_prompt=CHUNK_SUMMARY_PROMPT.format(text=chunk), cache_as="summary_chunk")
+
+
+def _map_chunks(chunks: List[str]) -> List[str]:
+    workers = max(1, min(SUMMARY_MAX_PARALLEL, len(chunks)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_summarize_chunk, chunks))
+
 
 def summarize(user_input):
-    return inference(user_prompt=SUMMARIZATION_PROMPT.format(text=user_input))
+    chunks = chunk_text(user_input)
+    if len(chunks) > 1:
+        logger.info("Map-reduce over %d chunks", len(chunks))
+
+    # Keep reducing until the partial summaries fit in a single prompt
+    for _ in range(SUMMARY_MAX_REDUCE_ROUNDS):
+        if len(chunks) == 1:
+            break
+        partials = _map_chunks(chunks)
+        chunks = chunk_text("\n\n".join(partials))
+
+    return inference(
+        user_prompt=SUMMARIZATION_PROMPT.format(text=_reduce_input(chunks)), cache_as="summary"
+    )
+
+
+async def _amap_chunks(chunks: List[str]) -> List[str]:
+    semaphore = asyncio.Semaphore(SUMMARY_MAX_PARALLEL)
+
+    async def summarize_chunk(chunk):
+        async with semaphore:
+            return await ainference(
+                user_prompt=CHUNK_SUMMARY_PROMPT.format(text=chunk), cache_as="summary_chunk"
+            )
+
+    return await asyncio.gather(*(summarize_chunk(chunk) for chunk in chunks))
+
+
+async def asummarize(user_input):
+    chunks = chunk_text(user_input)
+    if len(chunks) > 1:
+        logger.info("Map-reduce over %d chunks", len(chunks))
+
+    for _ in range(SUMMARY_MAX_REDUCE_ROUNDS):
+        if len(chunks) == 1:
+            break
+        partials = await _amap_chunks(chunks)
+        chunks = chunk_text("\n\n".join(partials))
+
+    return await ainference(
+        user_prompt=SUMMARIZATION_PROMPT.format(text=_reduce_input(chunks)),
+        stream_tokens=True,
+        cache_as="summary"
+    )
@@ -0,0 +1,106 @@
+import os
+import threading
+from typing import Dict, List, Optional
+
+from tools.log import get_logger
+
+# Whisper sizes a request may ask for (smaller = faster, less accurate)
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")
+WHISPER_MODELS = [m.strip() for m in os.getenv("WHISPER_MODELS", "tiny,base,small").split(",") if m.strip()]
+# Sizes loaded at server startup; others are loaded on first use
+WHISPER_PRELOAD = [m.strip() for m in os.getenv("WHISPER_PRELOAD", WHISPER_MODEL).split(",") if m.strip()]
+
+_models = {}
+_status = {}
+_loaded = {}
+# Decoding installs hooks on the model, so one decode per model at a time
+_decode_locks = {}
+_lock = threading.Lock()
+logger = get_logger("whisper")
+
+
+def _load(name: str):
+    import whisper
+    logger.info("Loading model: %s", name)
+    try:
+        model = whisper.load_model(name, device="cpu")
+    except Exception as e:
+        logger.error("Failed to load %s: %s", name, e)
+        with _lock:
+            _status[name] = f"failed: {str(e)}"
+            _loaded.pop(name).set()
+        raise
+
+    with _lock:
+        _models[name] = model
+        _decode_locks[name] = threading.Lock()
+        _status[name] = "ready"
+        _loaded[name].set()
+    logger.info("Model ready: %s", name)
+    return model
+
+
+def _claim(name: str) -> Optional[threading.Event]:
+    """Mark a model as loading; returns None if another thread already is"""
+    with _lock:
+        if name in _loaded:
+            return None
+        _loaded[name] = threading.Event()
+        _status[name] = "loading"
+        return _loaded[name]
+
+
+def get(name: Optional[str] = None):
+    """
+    Return a loaded model, waiting for a background preload if one is in
+    progress, or loading it here on first use
+    """
+    name = name or WHISPER_MODEL
+    if name not in WHISPER_MODELS:
+        raise ValueError(f"Unknown Whisper model '{name}', expected one of {WHISPER_MODELS}")
+
+    if name in _models:
+        return _models[name]
+
+    if _claim(name) is not None:
+        return _load(name)
+
+    with _lock:
+        event = _loaded.get(name)
+    if event is not None:
+        event.wait()
+    if name not in _models:
+        raise RuntimeError(f"Whisper model '{name}' failed to load: {_status.get(name)}")
+    return _models[name]
+
+
+def decode_lock(name: Optional[str] = None) -> threading.Lock:
+    return _decode_locks[name or WHISPER_MODEL]
+
+
+def preload(names: List[str] = WHISPER_PRELOAD) -> threading.Thread:
+    """Load models in a background thread so startup isn't blocked"""
+    claimed = [name for name in names if name in WHISPER_MODELS and _claim(name) is not None]
+
+    def run():
+        for name in claimed:
+            try:
+                _load(name)
+            except Exception:
+                pass
+
+    thread = threading.Thread(target=run, name="whisper-preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def status() -> Dict:
+    """Readiness of the default model and the state of every known model"""
+    with _lock:
+        models = dict(_status)
+    return {
+        "ready": models.get(WHISPER_MODEL) == "ready",
+        "default": WHISPER_MODEL,
+        "available": WHISPER_MODELS,
+        "models": models
+    }